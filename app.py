@@ -1,9 +1,24 @@
+import time
+
+STARTED = time.perf_counter()  # before the other imports, for the startup breakdown
+
 import argparse
+import gzip
+import http
+import importlib.util
+import logging
 import os
+import sys
+import signal
 
 import flask
 
 from stream import Stream
+from model import TRACKERS
+from scheduler import InferenceScheduler
+from utils import rest_property
+from metrics import MetricsWriter
+from store import HistoryStore
 
 parser = argparse.ArgumentParser(
     formatter_class=argparse.RawTextHelpFormatter, epilog=Stream.usage())
@@ -13,8 +28,12 @@ parser.add_argument("--port", default=8050, type=int, help="port used for webser
 parser.add_argument("--ssl-key", default=os.getenv('SSL_KEY'), type=str, help="path to PEM-encoded SSL/TLS key file for enabling HTTPS")
 parser.add_argument("--ssl-cert", default=os.getenv('SSL_CERT'), type=str, help="path to PEM-encoded SSL/TLS certificate file for enabling HTTPS")
 parser.add_argument("--title", default='V3M Cam', type=str, help="the title of the webpage as shown in the browser")
-parser.add_argument("--input", default='/dev/video0', type=str, help="input camera stream or video file")
-parser.add_argument("--output", default='webrtc://@:8554/output', type=str, help="WebRTC output stream to serve from --input")
+parser.add_argument("--input", default='/dev/video0', type=str, help="input camera stream(s) or video file(s) (comma-separated for multiple cameras)")
+parser.add_argument("--output", default='webrtc://@:8554/output', type=str, help="WebRTC output stream(s) to serve from --input (comma-separated, or a single one that gets\nthe stream index appended for the additional cameras)")
+parser.add_argument("--priority", default='', type=str, help="scheduling priority of each input (comma-separated integers, higher runs first)")
+parser.add_argument("--schedule", default='round-robin', choices=InferenceScheduler.POLICIES, help="how cameras sharing the models take turns running inference\n(batch gathers the latest frames of all cameras and runs them back-to-back)")
+parser.add_argument("--batch-wait", default=5, type=float, help="milliseconds a frame waits for the other cameras' frames to fill a batch (default is 5)")
+parser.add_argument("--max-batch", default=0, type=int, help="the most frames run per batch (default is 0, one per camera)")
 # parser.add_argument("--detection", default='peoplenet', type=str, help="load object detection model (see detectNet arguments)")
 parser.add_argument("--detection", default='ssd-mobilenet-v2', type=str, help="load object detection model (see detectNet arguments)")
 
@@ -25,24 +44,192 @@ parser.add_argument("--action", default='', type=str, help="load action recognit
 parser.add_argument("--pose", default='', type=str, help="load action recognition model (see actionNet arguments)")
 parser.add_argument("--labels", default='', type=str, help="path to labels.txt for loading a custom model")
 parser.add_argument("--colors", default='', type=str, help="path to colors.txt for loading a custom model")
+parser.add_argument("--engine-cache", default='', type=str, help="directory to keep the TensorRT engines built from model files in (default is next to the model)")
+parser.add_argument("--warmup-frames", default=3, type=int, help="blank frames to run the models on before processing the stream (default is 3, 0 to disable)")
+parser.add_argument("--tracker", default='auto', choices=['auto', 'builtin'] + list(TRACKERS), help="how to give people track IDs: detectNet's built-in tracker, or iou, a CPU tracker per stream\n(default is auto, builtin with one input, iou with several as they share the detector)")
+parser.add_argument("--tracker-min-frames", default=3, type=int, help="frames a person must be detected in before being tracked (default is 3)")
+parser.add_argument("--tracker-drop-frames", default=20, type=int, help="frames a person can go undetected before their track is dropped (default is 20)")
+parser.add_argument("--tracker-overlap", default=0.3, type=float, help="minimum IoU of a detection with a track to continue it (default is 0.3)")
+parser.add_argument("--tracker-matching", default='greedy', choices=['greedy', 'hungarian'], help="how --tracker=iou matches detections to tracks: highest IoU first, or optimally (needs scipy)")
+parser.add_argument("--tracker-kalman", action='store_true', help="with --tracker=iou, match detections against the positions predicted by a Kalman filter")
+parser.add_argument("--class-profile", default='', type=str, help="JSON (or path to a JSON file) saying which classes are people and how to count them, e.g.\n{\"people\": [\"person\"], \"count\": \"max\", \"count_classes\": [\"person\", \"face\"]}\n(built-in for peoplenet and the SSD models)")
 parser.add_argument("--input-layer", default='', type=str, help="name of input layer for loading a custom model")
 parser.add_argument("--output-layer", default='', type=str, help="name of output layer(s) for loading a custom model (comma-separated if multiple)")
 
 parser.add_argument("--log", default='log.csv', type=str, help="path to CSV log file for tracking people")
-
-args = parser.parse_known_args()[0]
+parser.add_argument("--log-level", default='info', choices=['debug', 'info', 'warning', 'error'], help="level of the console logging (default is info, debug includes per-frame counts)")
+parser.add_argument("--capture-timeout", default=1000, type=int, help="milliseconds to wait for each frame from the input (default is 1000)")
+parser.add_argument("--stall-timeout", default=10, type=float, help="seconds without a frame before the input is reopened (default is 10)")
+parser.add_argument("--reconnect-min", default=1, type=float, help="seconds to wait before reopening a failed input, doubling on each failure (default is 1)")
+parser.add_argument("--reconnect-max", default=60, type=float, help="maximum seconds to wait between attempts to reopen a failed input (default is 60)")
+parser.add_argument("--log-interval", default=10.0, type=float, help="seconds between repeated console messages (frame progress, errors) per stream (default is 10)")
+parser.add_argument("--log-flush-interval", default=1.0, type=float, help="seconds between flushes of the CSV log (default is 1.0)")
+parser.add_argument("--log-batch-size", default=500, type=int, help="maximum number of rows written to the CSV log per flush")
+parser.add_argument("--log-queue-size", default=10000, type=int, help="number of rows buffered for the CSV log before new rows are dropped")
+parser.add_argument("--log-rotate", default='none', choices=['none', 'daily', 'size'], help="rotate the CSV log daily or when it reaches --log-max-size")
+parser.add_argument("--log-max-size", default=100, type=float, help="size in MB at which the CSV log is rotated (with --log-rotate=size)")
+parser.add_argument("--log-compress", action='store_true', help="gzip rotated CSV logs")
+parser.add_argument("--pipeline", action='store_true', help="run capture, inference, analytics and rendering in separate threads")
+parser.add_argument("--pipeline-queue-size", default=2, type=int, help="number of frames buffered between the pipeline's later stages (default is 2)")
+parser.add_argument("--motion-gate", action='store_true', help="skip detection on frames without motion, reusing the previous detections")
+parser.add_argument("--motion-threshold", default=0.01, type=float, help="fraction of pixels that must change to count as motion (default is 0.01)")
+parser.add_argument("--motion-pixel-threshold", default=20, type=int, help="change in a pixel's luma (0-255) to count it as changed (default is 20)")
+parser.add_argument("--motion-force-interval", default=30, type=int, help="run detection at least every N frames, even without motion (default is 30)")
+parser.add_argument("--target-fps", default=0, type=float, help="skip detection on some frames to sustain this frame rate (default is 0, detect on every frame)")
+parser.add_argument("--inference-budget", default=0, type=float, help="skip detection on some frames to keep it under this fraction of the time (0-1, default is 0, disabled)")
+parser.add_argument("--max-inference-interval", default=10, type=int, help="run detection at least every N frames when skipping for --target-fps/--inference-budget")
+parser.add_argument("--roi", default='', type=str, help="regions of interest to run detection on, as JSON or a path to a JSON file:\na list of rectangles [left, top, right, bottom] and/or polygons [[x, y], ...] in pixels")
+parser.add_argument("--lines", default='', type=str, help="virtual lines to count the people crossing (in/out), as JSON or a path to a JSON file:\na list of {\"name\": ..., \"line\": [[x1, y1], [x2, y2]]} in pixels, crossing from right to left of (x1, y1) -> (x2, y2) is in")
+parser.add_argument("--lines-retention", default=604800, type=int, help="seconds to keep the per-minute line crossing counts for (default is 604800, one week)")
+parser.add_argument("--heatmap-grid", default='64x36', type=str, help="resolution of the occupancy heatmap, as COLSxROWS cells (default is 64x36)")
+parser.add_argument("--heatmap-slice", default=3600, type=int, help="length in seconds of the time slices kept for windowed heatmaps (default is 3600)")
+parser.add_argument("--heatmap-retention", default=86400, type=int, help="seconds to keep the heatmap slices for (default is 86400, one day)")
+parser.add_argument("--heatmap-interval", default=10, type=float, help="seconds the rendered heatmap tiles are cached for (default is 10)")
+parser.add_argument("--events-interval", default=0.2, type=float, help="minimum seconds between /events pushes when the count changes (default is 0.2)")
+parser.add_argument("--always-render", action='store_true', help="render the WebRTC output at full rate even when nobody is watching")
+parser.add_argument("--preview-fps", default=1.0, type=float, help="frame rate of the WebRTC output while nobody is watching (default is 1, 0 to stop rendering)")
+parser.add_argument("--raw-history", default=18000, type=int, help="number of raw per-frame counts to keep in memory (default is 18000, ~10 minutes at 30 fps)")
+parser.add_argument("--history-retention", default='86400,2592000,31536000', type=str, help="seconds to keep the 1 second, 1 minute and 1 hour count rollups in memory (comma-separated)")
+parser.add_argument("--dwell-accuracy", default=0.01, type=float, help="relative accuracy of the dwell-time percentiles (default is 0.01)")
+parser.add_argument("--dwell-slice", default=3600, type=int, help="length in seconds of the time slices kept for windowed dwell-time statistics (default is 3600)")
+parser.add_argument("--store", default='history.db', type=str, help="path to the SQLite database the per-second counts and their hourly/daily rollups are saved to\n(default is history.db, '' to disable)")
+parser.add_argument("--store-retention", default=2592000, type=int, help="seconds to keep the per-second counts in the database, the rollups are kept (default is 2592000, 30 days)")
+parser.add_argument("--checkpoint", default='checkpoint.npz', type=str, help="path to the checkpoint of the analytics state (history, dwell times, people in view),\nrestored on startup (default is checkpoint.npz, '' to disable)")
+parser.add_argument("--checkpoint-interval", default=60, type=float, help="seconds between checkpoints, one is also saved on exit (default is 60)")
+parser.add_argument("--shm-dir", default='', type=str, help="publish each stream's live analytics to a memory-mapped file in this directory\n(e.g. /dev/shm, read with bus.py, default is disabled)")
+parser.add_argument("--server", default='auto', choices=['auto', 'waitress', 'threaded', 'debug'], help="web server to run: waitress (pip3 install waitress), Flask's threaded server, or its debug server\n(default is auto, waitress when it's installed and HTTPS isn't used)")
+parser.add_argument("--server-threads", default=32, type=int, help="number of waitress worker threads, each open /events stream holds one (default is 32)")
+parser.add_argument("--gzip-min-size", default=1024, type=int, help="gzip JSON and text responses of at least this many bytes (default is 1024, 0 to disable)")
+parser.add_argument("--static-max-age", default=3600, type=int, help="seconds browsers may cache the static files for before revalidating them (default is 3600)")
+parser.add_argument("--dwell-retention", default=604800, type=int, help="seconds to keep the dwell-time slices for (default is 604800, one week)")
 
 app = flask.Flask(__name__)
-stream = Stream(args)
+args = None
+streams = {}
+startup = {'imports': time.perf_counter() - STARTED}  # step => seconds it took
+
+# mimetypes of the responses that get gzipped
+COMPRESSED_TYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+
+def create_streams(args):
+    """
+    Create a stream per --input.  With several inputs, the models are loaded once and
+    shared between the streams, which take turns running inference through a scheduler
+    (and track their people with their own trackers, see --tracker).
+    Each stream gets its own output (see --output), log (<log>.<id>.csv) and checkpoint,
+    and they all save their history to the same --store.
+    """
+    inputs = args.input.split(',')
+    outputs = args.output.split(',')
+    priorities = [int(priority) for priority in args.priority.split(',') if priority]
+    store = HistoryStore(args.store, retention=args.store_retention) if args.store else None
+
+    if len(inputs) == 1:
+        return {'0': Stream(args, store=store)}
+
+    models = Stream.load_models(args)
+    scheduler = InferenceScheduler(args.schedule, batch_wait=args.batch_wait / 1000, max_batch=args.max_batch)
+    log_root, log_ext = os.path.splitext(args.log)
+    checkpoint_root, checkpoint_ext = os.path.splitext(args.checkpoint)
+    streams = {}
+
+    for index, input in enumerate(inputs):
+        id = str(index)
+        output = outputs[index] if index < len(outputs) else f"{outputs[-1]}{index}"
+        log = f"{log_root}.{id}{log_ext}" if args.log else ''
+        checkpoint = f"{checkpoint_root}.{id}{checkpoint_ext}" if args.checkpoint else ''
+        scheduler.register(id, priorities[index] if index < len(priorities) else 0)
+        streams[id] = Stream(args, id=id, input=input, output=output, log=log, models=models, scheduler=scheduler, store=store, checkpoint=checkpoint)
+
+    return streams
+
+
+def init(argv=None):
+    """
+    Parse the command line and create the streams (without starting them).
+    """
+    global args
+
+    args = parser.parse_known_args(argv)[0]
+
+    # the streams of several inputs share a detectNet, whose tracker would mix up their people
+    if len(args.input.split(',')) > 1:
+        if args.tracker == 'builtin':
+            parser.error("--tracker=builtin can't be used with several inputs (they share the detector), use --tracker=iou")
+        if args.tracker == 'auto':
+            args.tracker = 'iou'
+    elif args.tracker == 'auto':
+        args.tracker = 'builtin'
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = args.static_max_age
+
+    start = time.perf_counter()
+    streams.update(create_streams(args))
+    startup['streams'] = time.perf_counter() - start
+
+    return app
+
+
+def shutdown(timeout=10.0):
+    """
+    Stop the streams, wait for them to finish their frame, and save what they have pending
+    (final checkpoints, logs and the buckets not yet in the store) before closing the store.
+    """
+    for stream in streams.values():
+        stream.stop()
+
+    for stream in streams.values():
+        if stream.is_alive():
+            stream.join(timeout=timeout)
+
+        stream.close()
+
+    for store in {id(stream.store): stream.store for stream in streams.values() if stream.store is not None}.values():
+        store.close()
+
+
+def get_stream(stream_id):
+    if stream_id not in streams:
+        flask.abort(http.HTTPStatus.NOT_FOUND)
+    return streams[stream_id]
+
+
+@app.after_request
+def compress(response):
+    """
+    Gzip JSON and text responses for the clients that accept it (streamed
+    responses like /events and file downloads are passed through as-is).
+    """
+    if (not args.gzip_min_size or response.status_code != http.HTTPStatus.OK
+            or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSED_TYPES or 'Content-Encoding' in response.headers
+            or 'gzip' not in flask.request.accept_encodings):
+        return response
+
+    data = response.get_data()
+
+    if len(data) < args.gzip_min_size:
+        return response
 
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
 
-@app.route('/')
-def index():
+
+@app.route('/', defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/')
+def index(stream_id):
+    stream = get_stream(stream_id)
     return flask.render_template(
         'index.html',
         send_webrtc=False,
-        input_stream=args.input,
-        output_stream=args.output,
+        base=f"/streams/{stream.id}",
+        input_stream=stream.input_url,
+        output_stream=stream.output_url,
+        output_name=stream.output_url.rstrip('/').rsplit('/', 1)[-1],
         classification=os.path.basename(args.classification),
         detection=os.path.basename(args.detection),
         segmentation=os.path.basename(args.segmentation),
@@ -51,28 +238,400 @@ def index():
         background=os.path.basename(args.background)
     )
 
-@app.route('/data', methods=['GET'])
-def data():
-    return flask.jsonify(history=stream.count_history)
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe:  200 once every stream warmed up its models and processed a frame, 503 until then.
+    Includes the startup timing breakdown (in seconds) of the app, the streams and the models.
+    """
+    is_ready = bool(streams) and all(stream.ready.is_set() for stream in streams.values())
+    models = {key: dict(model.timings, engine_cached=model.engine_cached) for key, model in streams['0'].models.items()} if streams else {}
+
+    return flask.jsonify(ready=is_ready, startup=startup, streams={id: stream.startup for id, stream in streams.items()}, models=models), \
+        http.HTTPStatus.OK if is_ready else http.HTTPStatus.SERVICE_UNAVAILABLE
+
+@app.route('/health', methods=['GET'])
+def health():
+    """
+    Liveness probe:  200 unless a stream's input failed or stalled and is being reconnected (503).
+    Includes the state (connecting, streaming or degraded) and failure counters of each input.
+    """
+    inputs = {id: stream.input.health() for id, stream in streams.items()}
+    healthy = all(input['state'] != 'degraded' for input in inputs.values())
+
+    return flask.jsonify(healthy=healthy, streams=inputs), \
+        http.HTTPStatus.OK if healthy else http.HTTPStatus.SERVICE_UNAVAILABLE
+
+@app.route('/streams', methods=['GET'])
+def streams_list():
+    return flask.jsonify({id: {'input': stream.input_url, 'output': stream.output_url, 'log': stream.log_path, 'state': stream.input.state}
+                          for id, stream in streams.items()})
+
+@app.route('/data', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/data', methods=['GET'])
+def data(stream_id):
+    """
+    Per-second max people count, rolled up server-side.
+
+    Query parameters:
+
+        since (int) -- only return buckets after this epoch second (the `cursor` of a previous response)
+        limit (int) -- only return the last N buckets
+        stats (str) -- comma-separated extra columns to append to each point (min, avg)
+        resolution (int) -- bucket size in seconds (1, 60 or 3600, default is 1)
+        from, to (int) -- epoch seconds of a range to read from the --store instead of memory
+                          (resolution can then also be 86400, and defaults to the finest one
+                          returning at most 5000 buckets)
+    """
+    stream = get_stream(stream_id)
+
+    if 'from' in flask.request.args or 'to' in flask.request.args:
+        return data_range(stream)
+
+    since = flask.request.args.get('since', type=int)
+    limit = flask.request.args.get('limit', type=int)
+    resolution = flask.request.args.get('resolution', default=1, type=int)
+    stats = [stat for stat in flask.request.args.get('stats', '').split(',') if stat in ('min', 'avg')]
+
+    # the response only changes when a bucket closes or the live count does,
+    # so clients polling faster than that get a 304 without serializing anything
+    try:
+        count = stream.count_history.last_count()
+        etag = f"{os.getpid()}-{stream.count_history.version(resolution)}-{count}"
+
+        if flask.request.if_none_match.contains_weak(etag):
+            response = flask.Response(status=http.HTTPStatus.NOT_MODIFIED)
+            response.set_etag(etag, weak=True)
+            return response
+
+        times, maxima, minima, averages = stream.count_history.series(resolution=resolution, since=since, limit=limit)
+    except ValueError as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+    columns = [(times * 1000).astype(int).tolist(), maxima.tolist()]
+    columns += [minima.tolist() if stat == 'min' else averages.round(2).tolist() for stat in stats]
+    cursor = int(times[-1]) if len(times) else since
+
+    response = flask.jsonify(history=[list(point) for point in zip(*columns)], cursor=cursor, count=count)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def data_range(stream):
+    """
+    /data over a time range, read from the persistent store.
+    """
+    if stream.store is None:
+        return flask.jsonify(error="the history isn't stored (see --store)"), http.HTTPStatus.NOT_FOUND
+
+    start = flask.request.args.get('from', type=int)
+    end = flask.request.args.get('to', type=int)
+    limit = flask.request.args.get('limit', type=int)
+    resolution = flask.request.args.get('resolution', type=int)
+    stats = [stat for stat in flask.request.args.get('stats', '').split(',') if stat in ('min', 'avg')]
+
+    try:
+        times, maxima, minima, averages, resolution = stream.store.query(stream.id, start=start, end=end, resolution=resolution, limit=limit)
+    except ValueError as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+    columns = [(times * 1000).astype(int).tolist(), maxima.tolist()]
+    columns += [minima.tolist() if stat == 'min' else averages.round(2).tolist() for stat in stats]
+    cursor = int(times[-1]) if len(times) else start
+
+    return flask.jsonify(history=[list(point) for point in zip(*columns)], cursor=cursor, resolution=resolution)
+
+@app.route('/durations', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/durations', methods=['GET'])
+def durations(stream_id):
+    """
+    Dwell-time statistics (count, mean, min/max, p50/p90/p99 in ms).
+
+    Query parameters:
+
+        window (int) -- only include people that left in the last N seconds (rounded to --dwell-slice)
+        current (int) -- include the people still in the frame (1, the default) or not (0)
+    """
+    window = flask.request.args.get('window', type=int)
+    current = flask.request.args.get('current', default=1, type=int)
+    return flask.jsonify(get_stream(stream_id).get_duration_stats(window=window, current=bool(current)))
+
+
+@app.route('/events', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/events', methods=['GET'])
+def events(stream_id):
+    """
+    Server-Sent Events stream of the live count, the latest per-second point and the dwell statistics.
+    """
+    return flask.Response(get_stream(stream_id).events.subscribe(), mimetype='text/event-stream',
+                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/log/stats', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/log/stats', methods=['GET'])
+def log_stats(stream_id):
+    stream = get_stream(stream_id)
+    if not stream.log:
+        return flask.jsonify({})
+    return flask.jsonify(stream.log.stats())
 
-@app.route('/durations', methods=['GET'])
-def durations():
-    return flask.jsonify(history=stream.get_duration_history())
 
+@app.route('/pipeline/stats', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/pipeline/stats', methods=['GET'])
+def pipeline_stats(stream_id):
+    return flask.jsonify(get_stream(stream_id).get_stage_stats())
 
-@app.route('/download')
-def download():
-    if not args.log:
+
+@app.route('/motion/stats', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/motion/stats', methods=['GET'])
+def motion_stats(stream_id):
+    stream = get_stream(stream_id)
+    if stream.motion_gate is None:
+        return flask.jsonify({})
+    return flask.jsonify(stream.motion_gate.stats())
+
+
+@app.route('/detection/inference_interval', methods=['GET', 'PUT'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/detection/inference_interval', methods=['GET', 'PUT'])
+def detection_inference_interval(stream_id):
+    stream = get_stream(stream_id)
+    try:
+        return rest_property(stream.rate.get_interval, stream.rate.set_interval, int)
+    except (TypeError, ValueError) as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+@app.route('/detection/target_fps', methods=['GET', 'PUT'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/detection/target_fps', methods=['GET', 'PUT'])
+def detection_target_fps(stream_id):
+    stream = get_stream(stream_id)
+    try:
+        return rest_property(stream.rate.get_target_fps, stream.rate.set_target_fps, float)
+    except (TypeError, ValueError) as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+@app.route('/detection/inference_budget', methods=['GET', 'PUT'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/detection/inference_budget', methods=['GET', 'PUT'])
+def detection_inference_budget(stream_id):
+    stream = get_stream(stream_id)
+    try:
+        return rest_property(stream.rate.get_budget, stream.rate.set_budget, float)
+    except (TypeError, ValueError) as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+@app.route('/detection/inference_rate', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/detection/inference_rate', methods=['GET'])
+def detection_inference_rate(stream_id):
+    return flask.jsonify(get_stream(stream_id).rate.stats())
+
+
+@app.route('/detection/roi', methods=['GET', 'PUT'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/detection/roi', methods=['GET', 'PUT'])
+def detection_roi(stream_id):
+    stream = get_stream(stream_id)
+    try:
+        return rest_property(stream.roi.get_regions, stream.roi.set_regions, list)
+    except (TypeError, ValueError) as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+
+@app.route('/lines', methods=['GET', 'PUT'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/lines', methods=['GET', 'PUT'])
+def lines(stream_id):
+    stream = get_stream(stream_id)
+    try:
+        return rest_property(stream.lines.get_lines, stream.lines.set_lines, list)
+    except (TypeError, ValueError) as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+
+@app.route('/footfall', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/footfall', methods=['GET'])
+def footfall(stream_id):
+    """
+    People that crossed the counting lines (--lines), in and out per line, the occupancy,
+    and the per-minute (or hourly) counts as [[epoch ms, in, out], ...] per line.
+
+    Query parameters:
+
+        since (int) -- only return the counts after this epoch second
+        limit (int) -- only return the last N points per line
+        resolution (int) -- 60 (per minute, the default) or 3600 (per hour)
+    """
+    since = flask.request.args.get('since', type=int)
+    limit = flask.request.args.get('limit', type=int)
+    resolution = flask.request.args.get('resolution', default=60, type=int)
+
+    try:
+        return flask.jsonify(get_stream(stream_id).lines.footfall(since, limit, resolution))
+    except ValueError as error:
+        return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+
+@app.route('/heatmap', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/heatmap', methods=['GET'])
+def heatmap(stream_id):
+    """
+    Where people stood, as person-seconds per cell of a --heatmap-grid grid over the frame (rows of cells).
+
+    Query parameters:
+
+        window (int) -- only include the last N seconds (rounded to --heatmap-slice)
+    """
+    return heatmap_tile(stream_id, 'json')
+
+@app.route('/heatmap.png', methods=['GET'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/heatmap.png', methods=['GET'])
+def heatmap_png(stream_id):
+    """
+    The heatmap as a transparent PNG overlay (one pixel per cell) to stretch over the video.
+    Takes the same query parameters as /heatmap.
+    """
+    return heatmap_tile(stream_id, 'png')
+
+def heatmap_tile(stream_id, format):
+    stream = get_stream(stream_id)
+    window = flask.request.args.get('window', type=int)
+    tile = stream.heatmap.tile(window, format)
+
+    # the JSON tiles are gzipped once per render and cached, rather than by compress() on every request
+    if format == 'json' and args.gzip_min_size and len(tile) >= args.gzip_min_size and 'gzip' in flask.request.accept_encodings:
+        response = flask.Response(stream.heatmap.tile(window, format, gzipped=True), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    else:
+        response = flask.Response(tile, mimetype='application/json' if format == 'json' else 'image/png')
+
+    response.headers['Cache-Control'] = f"max-age={int(stream.heatmap.interval)}"
+    return response
+
+
+@app.route('/viewers', methods=['GET', 'POST'], defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/viewers', methods=['GET', 'POST'])
+def viewers(stream_id):
+    """
+    POST a heartbeat (every few seconds) to keep the stream's video rendering while watching it
+    without the dashboard, or GET the number of viewers and frames rendered.
+    """
+    stream = get_stream(stream_id)
+    if flask.request.method == 'POST':
+        stream.viewers.heartbeat(flask.request.remote_addr)
+    return flask.jsonify(viewers=stream.viewers.count(), dashboards=stream.events.subscribers,
+                         headless=stream.headless, rendered=stream.rendered, frames=stream.frames)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Metrics of all the streams, in the Prometheus text exposition format.
+    """
+    writer = MetricsWriter()
+
+    for stream in streams.values():
+        stream.collect_metrics(writer)
+
+    scheduler = streams['0'].scheduler
+
+    if scheduler is not None:
+        for stream_id, stats in scheduler.stats().items():
+            writer.counter('scheduler_inferences_total', "Inferences run on the shared models", stats['served'], stream=stream_id)
+            writer.gauge('scheduler_wait_avg_seconds', "Average wait for a turn on the shared models", stats['wait_avg_ms'] / 1000, stream=stream_id)
+
+        writer.histogram('scheduler_queue_wait_seconds', "Wait of the inference requests for their turn (or batch)", scheduler.queue_wait)
+
+        for size, count in scheduler.batch_stats()['batch_sizes'].items():
+            writer.counter('scheduler_batches_total', "Inference batches run, by number of streams in the batch", count, size=size)
+
+    return flask.Response(writer.text(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/store/stats', methods=['GET'])
+def store_stats():
+    store = streams['0'].store
+    if store is None:
+        return flask.jsonify({})
+    return flask.jsonify(store.stats())
+
+
+@app.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    scheduler = streams['0'].scheduler
+    if scheduler is None:
+        return flask.jsonify({})
+    return flask.jsonify(dict(scheduler.stats(), batches=scheduler.batch_stats()))
+
+
+@app.route('/download', defaults={'stream_id': '0'})
+@app.route('/streams/<stream_id>/download')
+def download(stream_id):
+    """
+    Download the CSV log, or with any of these query parameters, an export from the --store:
+
+        from, to (int) -- epoch seconds of the range to export (defaults to everything)
+        resolution (int) -- bucket size in seconds (1, 60, 3600 or 86400, default is 60)
+        format (str) -- 'csv' for gzipped CSV (the default) or 'npz' for compressed numpy columns
+    """
+    stream = get_stream(stream_id)
+
+    if any(key in flask.request.args for key in ('from', 'to', 'resolution', 'format')):
+        if stream.store is None:
+            return flask.jsonify(error="the history isn't stored (see --store)"), http.HTTPStatus.NOT_FOUND
+
+        resolution = flask.request.args.get('resolution', default=60, type=int)
+        format = flask.request.args.get('format', default='csv')
+
+        try:
+            export = stream.store.export(stream.id, start=flask.request.args.get('from', type=int), end=flask.request.args.get('to', type=int),
+                                         resolution=resolution, format=format)
+        except ValueError as error:
+            return flask.jsonify(error=str(error)), http.HTTPStatus.BAD_REQUEST
+
+        filename = f"counts-{stream.id}-{resolution}s" + ('.csv.gz' if format == 'csv' else '.npz')
+        return flask.Response(export, mimetype='application/gzip' if format == 'csv' else 'application/octet-stream',
+                              headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+    if not stream.log_path:
         return ""
-    return flask.send_file(args.log, as_attachment=True)
+    return flask.send_file(os.path.abspath(stream.log_path), as_attachment=True)
+
+
+if __name__ == '__main__':
+    init()
+
+    # on Ctrl+C or SIGTERM (e.g. docker stop), stop the streams and save their state before exiting
+    def on_signal(signum, frame):
+        logging.getLogger(__name__).info("received %s, shutting down", signal.Signals(signum).name)
+        shutdown()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    # start stream threads
+    for stream in streams.values():
+        stream.start()
+
+    # check if HTTPS/SSL requested
+    ssl_context = None
+
+    if args.ssl_cert and args.ssl_key:
+        ssl_context = (args.ssl_cert, args.ssl_key)
+
+    server = args.server
+
+    if server == 'auto':
+        server = 'waitress' if importlib.util.find_spec('waitress') and not ssl_context else 'threaded'
 
-# start stream thread
-stream.start()
+        if server == 'threaded' and not ssl_context:
+            logging.getLogger(__name__).warning("waitress isn't installed, falling back to Flask's development server (pip3 install waitress)")
 
-# check if HTTPS/SSL requested
-ssl_context = None
+    logging.getLogger(__name__).info("serving on %s:%d with the %s server", args.host, args.port, server)
 
-if args.ssl_cert and args.ssl_key:
-    ssl_context = (args.ssl_cert, args.ssl_key)
+    # start the webserver
+    if server == 'waitress':
+        if ssl_context:
+            parser.error("waitress doesn't support HTTPS (use --server=threaded, or a reverse proxy)")
 
-app.run(host=args.host, port=args.port, ssl_context=ssl_context, debug=True, use_reloader=False)
+        import waitress
+        waitress.serve(app, host=args.host, port=args.port, threads=args.server_threads)
+    else:
+        app.run(host=args.host, port=args.port, ssl_context=ssl_context, debug=(server == 'debug'), threaded=True, use_reloader=False)
@@ -0,0 +1,325 @@
+"""
+Simulated stand-ins for jetson_utils and jetson_inference, so the stream can run
+on a plain Linux box.  A scripted scene of people walking through the view drives
+both the synthetic frames and the detections, and a simulated clock lets hours
+of footage be processed in minutes.
+
+Call install() before importing stream/model/app.
+"""
+import sys
+import time
+import math
+import random
+import types
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+class SimulatedClock:
+    """
+    Wall clock that advances by one frame period per captured frame, instead of in real time.
+    Stands in for the `datetime` and `time` modules of the stream (perf_counter and monotonic stay real).
+    """
+    perf_counter = staticmethod(time.perf_counter)
+    monotonic = staticmethod(time.monotonic)
+    sleep = staticmethod(time.sleep)
+
+    def __init__(self, start=None):
+        self.start = start or datetime(2023, 1, 1, 8, 0, 0)
+        self.elapsed = 0.0
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def time(self):
+        return self.start.timestamp() + self.elapsed
+
+
+class Scene:
+    """
+    People arriving at random (Poisson), walking across the view and leaving after a random dwell time.
+    By Little's law, the average number of people in view is `people`, and they are replaced every `dwell` seconds.
+    """
+    def __init__(self, width=640, height=360, people=5, dwell=30.0, miss_rate=0.0, seed=0, speed=1.0):
+        self.width = width
+        self.height = height
+        self.rate = people / dwell
+        self.dwell = dwell
+        self.miss_rate = miss_rate
+        self.speed = speed
+        self.random = random.Random(seed)
+        self.people = []  # [track_id, x, y, vx, vy, time left]
+        self.next_id = 0
+
+        for _ in range(int(people)):
+            self.spawn()
+
+    def spawn(self):
+        self.people.append([self.next_id, self.random.uniform(0, self.width), self.random.uniform(0, self.height),
+                            self.random.gauss(0, 20 * self.speed), self.random.gauss(0, 10 * self.speed), self.random.expovariate(1.0 / self.dwell)])
+        self.next_id += 1
+
+    def step(self, dt):
+        for person in self.people:
+            person[1] = min(max(person[1] + person[3] * dt, 0), self.width)
+            person[2] = min(max(person[2] + person[4] * dt, 0), self.height)
+            person[5] -= dt
+
+        self.people = [person for person in self.people if person[5] > 0]
+
+        # Poisson arrivals over the step
+        arrivals = 0
+        threshold = math.exp(-self.rate * dt)
+        p = self.random.random()
+
+        while p > threshold:
+            arrivals += 1
+            p *= self.random.random()
+
+        for _ in range(arrivals):
+            self.spawn()
+
+    def boxes(self):
+        """
+        Return the visible people as (track_id, left, top, right, bottom), minus the ones the detector misses.
+        """
+        return [(person[0], person[1] - 20, person[2] - 50, person[1] + 20, person[2] + 50)
+                for person in self.people if not self.miss_rate or self.random.random() >= self.miss_rate]
+
+
+class cudaImage:
+    """
+    Synthetic frame: the boxes of the people in it, rendered into pixels only when something reads them.
+    """
+    def __init__(self, width, height, format='rgb8', boxes=(), array=None):
+        self.width = width
+        self.height = height
+        self.format = format
+        self.boxes = boxes
+        self._array = array
+
+    @property
+    def array(self):
+        if self._array is None:
+            channels = 1 if self.format == 'gray8' else 3
+            self._array = np.full((self.height, self.width, channels), 64, dtype=np.uint8)
+
+            for track_id, left, top, right, bottom in self.boxes:
+                self._array[max(int(top), 0):max(int(bottom), 0), max(int(left), 0):max(int(right), 0)] = 64 + (track_id * 37) % 192
+
+        return self._array
+
+
+def cudaAllocMapped(width, height, format='rgb8', **kwargs):
+    return cudaImage(width, height, format, array=np.zeros((height, width, 1 if format == 'gray8' else 3), dtype=np.uint8))
+
+
+def cudaResize(input, output):
+    rows = np.arange(output.height) * input.height // output.height
+    cols = np.arange(output.width) * input.width // output.width
+    output.array[:] = input.array[rows][:, cols]
+
+
+def cudaConvertColor(input, output):
+    output.array[:] = input.array.mean(axis=2, keepdims=True).astype(np.uint8) if input.array.shape[2] == 3 else input.array
+
+
+def cudaCrop(input, output, roi):
+    left, top, right, bottom = roi
+    output.boxes = [(track_id, l - left, t - top, r - left, b - top) for track_id, l, t, r, b in input.boxes
+                    if r > left and l < right and b > top and t < bottom]
+    output._array = None
+
+
+def cudaToNumpy(img):
+    return img.array
+
+
+def cudaDeviceSynchronize():
+    pass
+
+
+class videoSource:
+    """
+    Video source that captures frames of a simulated scene, advancing the simulated clock by a frame each time.
+    """
+    clock = None
+    options = {}
+
+    def __init__(self, uri, argv=None):
+        self.uri = uri
+        self.fps = self.options.get('fps', 30.0)
+        self.latency = self.options.get('capture_ms', 0.0) / 1000
+        self.scene = Scene(**{key: value for key, value in self.options.items() if key in ('width', 'height', 'people', 'dwell', 'miss_rate', 'seed')})
+        self.frames = 0
+
+    def Capture(self, format='rgb8', timeout=-1):
+        if self.latency:
+            time.sleep(self.latency)
+
+        self.scene.step(1.0 / self.fps)
+
+        if self.clock is not None:
+            self.clock.advance(1.0 / self.fps)
+
+        self.frames += 1
+        return cudaImage(self.scene.width, self.scene.height, format, boxes=self.scene.boxes())
+
+    def GetFrameRate(self):
+        return self.fps
+
+    def IsStreaming(self):
+        return True
+
+    def Close(self):
+        pass
+
+    def GetWidth(self):
+        return self.scene.width
+
+    def GetHeight(self):
+        return self.scene.height
+
+    @staticmethod
+    def Usage():
+        return ''
+
+
+class videoOutput:
+    def __init__(self, uri, argv=None):
+        self.uri = uri
+        self.frames = 0
+
+    def Render(self, img):
+        self.frames += 1
+
+    @staticmethod
+    def Usage():
+        return ''
+
+
+class Detection:
+    __slots__ = ('ClassID', 'TrackID', 'TrackLost', 'Confidence', 'Left', 'Top', 'Right', 'Bottom')
+
+    def __init__(self, class_id, track_id, left, top, right, bottom, lost=0):
+        self.ClassID = class_id
+        self.TrackID = track_id
+        self.TrackLost = lost
+        self.Confidence = 0.9
+        self.Left = left
+        self.Top = top
+        self.Right = right
+        self.Bottom = bottom
+
+
+class detectNet:
+    """
+    Detector that returns the people of the frame's scene, labelled with the COCO classes of
+    ssd-mobilenet-v2.  With tracking enabled, their scene IDs are their track IDs, and like
+    the built-in tracker, the people it missed keep being reported at their last box (with
+    TrackLost counting the frames) for up to dropFrames frames.  Otherwise TrackID is -1.
+    """
+    LABELS = ['unlabeled', 'person', 'bicycle', 'car']
+    options = {}
+
+    def __init__(self, model='', labels='', colors='', input_blob='', output_cvg='', output_bbox='', **kwargs):
+        self.latency = self.options.get('inference_ms', 0.0) / 1000
+        self.tracking = {}
+        self.threshold = 0.5
+        self.tracks = {}  # track ID => (last box, frames lost)
+
+    def Detect(self, img, overlay='box,labels,conf'):
+        if self.latency:
+            time.sleep(self.latency)
+
+        if not self.tracking.get('enabled', False):
+            return [Detection(1, -1, *box) for _, *box in img.boxes]
+
+        detections = [Detection(1, track_id, left, top, right, bottom) for track_id, left, top, right, bottom in img.boxes]
+        seen = {detection.TrackID for detection in detections}
+        drop_frames = self.tracking.get('dropFrames', 20)
+
+        for track_id, (box, lost) in list(self.tracks.items()):
+            if track_id in seen:
+                continue
+
+            if lost >= drop_frames:
+                del self.tracks[track_id]
+                continue
+
+            self.tracks[track_id] = (box, lost + 1)
+            detections.append(Detection(1, track_id, *box, lost=lost + 1))
+
+        for track_id, left, top, right, bottom in img.boxes:
+            self.tracks[track_id] = ((left, top, right, bottom), 0)
+
+        return detections
+
+    def Overlay(self, img, detections, overlay='box,labels,conf'):
+        pass
+
+    def GetNumClasses(self):
+        return len(self.LABELS)
+
+    def GetClassDesc(self, class_id):
+        return self.LABELS[class_id]
+
+    def SetTrackingEnabled(self, enabled):
+        self.tracking['enabled'] = enabled
+
+    def IsTrackingEnabled(self):
+        return self.tracking.get('enabled', False)
+
+    def SetTrackingParams(self, **kwargs):
+        self.tracking.update(kwargs)
+
+    def GetTrackingParams(self):
+        return self.tracking
+
+    def SetConfidenceThreshold(self, threshold):
+        self.threshold = threshold
+
+    def GetConfidenceThreshold(self):
+        return self.threshold
+
+    @staticmethod
+    def Usage():
+        return ''
+
+
+def install(clock=None, **options):
+    """
+    Register the fakes as the jetson_utils and jetson_inference modules.
+
+    Parameters:
+
+        clock (SimulatedClock) -- advanced by the video sources on every frame
+        options -- scene and timing options:  width, height, fps, people, dwell, miss_rate, seed,
+                   capture_ms and inference_ms (simulated latencies)
+    """
+    videoSource.clock = clock
+    videoSource.options = options
+    detectNet.options = options
+
+    utils = types.ModuleType('jetson_utils')
+
+    for name in ('cudaImage', 'cudaAllocMapped', 'cudaResize', 'cudaConvertColor', 'cudaCrop',
+                 'cudaToNumpy', 'cudaDeviceSynchronize', 'videoSource', 'videoOutput'):
+        setattr(utils, name, globals()[name])
+
+    utils.cudaFont = object
+    utils.Log = object
+
+    inference = types.ModuleType('jetson_inference')
+    inference.detectNet = detectNet
+
+    # only detection is simulated; the other networks just need to exist for the imports
+    for name in ('imageNet', 'segNet', 'poseNet', 'actionNet', 'backgroundNet'):
+        setattr(inference, name, type(name, (), {'Usage': staticmethod(lambda: '')}))
+
+    sys.modules['jetson_utils'] = utils
+    sys.modules['jetson_inference'] = inference
@@ -0,0 +1,173 @@
+"""
+Benchmark the stream's per-frame processing and the dashboard's endpoints without a Jetson,
+on simulated video and detections (see fakes.py), over hours of simulated time.
+
+    python3 benchmark/run.py --hours 2 --fps 30 --people 8 --dwell 45
+    python3 benchmark/run.py --hours 24 --fps 5 --json > results.json
+
+Arguments that aren't recognized are passed on to the app (e.g. --motion-gate, --log-rotate=size).
+The persistent store and the checkpoint are disabled, unless given (e.g. --store /tmp/history.db),
+so runs don't resume from each other or leave files behind.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+parser.add_argument("--hours", default=1.0, type=float, help="hours of video to simulate (default is 1)")
+parser.add_argument("--fps", default=30.0, type=float, help="frame rate of the simulated camera (default is 30)")
+parser.add_argument("--people", default=5.0, type=float, help="average number of people in view (default is 5)")
+parser.add_argument("--dwell", default=30.0, type=float, help="average seconds a person stays in view (default is 30)")
+parser.add_argument("--miss-rate", default=0.0, type=float, help="fraction of people the simulated detector misses per frame (default is 0)")
+parser.add_argument("--width", default=640, type=int, help="width of the simulated frames")
+parser.add_argument("--height", default=360, type=int, help="height of the simulated frames")
+parser.add_argument("--inference-ms", default=0.0, type=float, help="simulated detection latency in ms (default is 0, to measure the app's own overhead)")
+parser.add_argument("--poll-interval", default=10.0, type=float, help="simulated seconds between dashboard polls of /data and /durations (default is 10)")
+parser.add_argument("--report-interval", default=0.25, type=float, help="fraction of the run between progress reports (default is 0.25)")
+parser.add_argument("--log", default='', type=str, help="path of the CSV log (default is a temporary file)")
+parser.add_argument("--seed", default=0, type=int, help="seed of the simulated scene")
+parser.add_argument("--json", action='store_true', help="print the results as JSON")
+
+
+def rss_mb():
+    """
+    Resident memory of this process in MB (Linux only).
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return float('nan')
+
+
+def percentiles(samples):
+    """
+    Return the p50/p90/p99/max of latency samples (in seconds) in ms.
+    """
+    if not samples:
+        return {}
+
+    samples = np.asarray(samples) * 1000
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99]).round(3).tolist()
+    return {'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': round(float(samples.max()), 3)}
+
+
+def main():
+    args, app_argv = parser.parse_known_args()
+
+    clock = fakes.SimulatedClock()
+    fakes.install(clock, fps=args.fps, people=args.people, dwell=args.dwell, miss_rate=args.miss_rate,
+                  width=args.width, height=args.height, inference_ms=args.inference_ms, seed=args.seed)
+
+    import app
+    import stream as stream_module
+
+    # the analytics run on the simulated wall clock, the latency measurements on the real one
+    stream_module.datetime = clock
+    stream_module.time = clock
+
+    log_path = args.log or os.path.join(tempfile.mkdtemp(prefix='v3m-benchmark-'), 'log.csv')
+
+    # keep the model loading output off stdout, so --json prints just the results
+    with contextlib.redirect_stdout(sys.stderr):
+        app.init(['--input', 'sim://camera', '--output', 'sim://output', '--log', log_path,
+                  '--log-level', 'warning', '--log-flush-interval', '0.1', '--store', '', '--checkpoint', ''] + app_argv)
+
+    stream = app.streams['0']
+    stream.warmup()
+    client = app.app.test_client()
+
+    frames = int(args.hours * 3600 * args.fps)
+    poll_frames = max(1, int(args.poll_interval * args.fps))
+    report_frames = max(1, int(frames * args.report_interval))
+
+    frame_latency = []
+    endpoint_latency = {'/data?since': [], '/data?limit': [], '/durations': []}
+    memory = [(0, rss_mb())]
+    cursor = 0
+
+    start = time.perf_counter()
+
+    for frame in range(1, frames + 1):
+        frame_start = time.perf_counter()
+        stream.process()
+        frame_latency.append(time.perf_counter() - frame_start)
+
+        if frame % poll_frames == 0:
+            for name, url in (('/data?since', f'/data?since={cursor}'), ('/data?limit', '/data?limit=20'), ('/durations', '/durations')):
+                request_start = time.perf_counter()
+                response = client.get(url)
+                endpoint_latency[name].append(time.perf_counter() - request_start)
+
+                if name == '/data?since':
+                    cursor = response.get_json()['cursor']
+
+        if frame % report_frames == 0:
+            memory.append((frame, rss_mb()))
+
+            if not args.json:
+                print(f"{clock.elapsed / 3600:6.2f} simulated hours, {frame / (time.perf_counter() - start):8.1f} fps, "
+                      f"{memory[-1][1]:7.1f} MB RSS", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+
+    if stream.log:
+        stream.log.close()
+
+    results = {
+        'simulated_hours': round(clock.elapsed / 3600, 3),
+        'frames': frames,
+        'seconds': round(elapsed, 3),
+        'fps': round(frames / elapsed, 1),
+        'realtime_factor': round(clock.elapsed / elapsed, 1),
+        'frame_latency': percentiles(frame_latency),
+        'stages': stream.get_stage_stats(),
+        'endpoints': {name: dict(percentiles(samples), requests=len(samples)) for name, samples in endpoint_latency.items()},
+        'memory_mb': {'start': round(memory[0][1], 1), 'end': round(memory[-1][1], 1),
+                      'growth': round(memory[-1][1] - memory[0][1], 1),
+                      'samples': [(frame, round(mb, 1)) for frame, mb in memory]},
+        'durations': client.get('/durations').get_json(),
+        'footfall': {key: value for key, value in client.get('/footfall?limit=0').get_json().items() if key != 'history'},
+        'log': stream.log.stats() if stream.log else {},
+        'log_size_mb': round(os.path.getsize(log_path) / 1048576, 2) if os.path.exists(log_path) else 0,
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{results['frames']} frames ({results['simulated_hours']} simulated hours) in {results['seconds']} s "
+          f"= {results['fps']} fps ({results['realtime_factor']}x realtime)")
+    print(f"frame latency:  {results['frame_latency']}")
+
+    for name, stats in results['endpoints'].items():
+        print(f"{name + ':':16s}{stats}")
+
+    print(f"memory:         {results['memory_mb']['start']} -> {results['memory_mb']['end']} MB "
+          f"({results['memory_mb']['growth']:+} MB)")
+    print(f"CSV log:        {results['log']} ({results['log_size_mb']} MB)")
+    print(f"dwell times:    {results['durations']}")
+
+    if stream.lines:
+        print(f"footfall:       {results['footfall']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark the CPU trackers (--tracker) on synthetic tracks:  the simulated scene of fakes.py,
+whose people IDs are the ground truth, with the detector missing people and jittering the boxes.
+Reports the per-frame latency, how well the track IDs follow the people, and how often the
+stream's TrackTable sees each person enter (more than once when their track is cut by misses,
+which splits their dwell time).
+
+    python3 benchmark/tracking.py --people 150 --fps 30 --seconds 60
+    python3 benchmark/tracking.py --people 50 --speed 10 --miss-rate 0.1 --json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import importlib.util
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+from run import percentiles
+from tracks import TrackTable
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+parser.add_argument("--seconds", default=60.0, type=float, help="seconds of video to simulate (default is 60)")
+parser.add_argument("--fps", default=30.0, type=float, help="frame rate of the simulated camera (default is 30)")
+parser.add_argument("--people", default=150.0, type=float, help="average number of people in view (default is 150)")
+parser.add_argument("--dwell", default=30.0, type=float, help="average seconds a person stays in view (default is 30)")
+parser.add_argument("--speed", default=1.0, type=float, help="how fast people walk, relative to the default scene (default is 1)")
+parser.add_argument("--miss-rate", default=0.05, type=float, help="fraction of people the simulated detector misses per frame (default is 0.05)")
+parser.add_argument("--jitter", default=2.0, type=float, help="standard deviation of the noise on the box coordinates, in pixels (default is 2)")
+parser.add_argument("--width", default=1920, type=int, help="width of the simulated frames")
+parser.add_argument("--height", default=1080, type=int, help="height of the simulated frames")
+parser.add_argument("--seed", default=0, type=int, help="seed of the simulated scene")
+parser.add_argument("--json", action='store_true', help="print the results as JSON")
+
+
+class Box(fakes.Detection):
+    """
+    Detection that knows which person of the scene it is (the ground truth).
+    """
+    __slots__ = ('person',)
+
+    def __init__(self, person, left, top, right, bottom):
+        super().__init__(1, -1, left, top, right, bottom)
+        self.person = person
+
+
+def simulate(args):
+    """
+    Return the frames of the scene, as (ground-truth IDs, N x 4 boxes with jitter).
+    """
+    scene = fakes.Scene(args.width, args.height, args.people, args.dwell, args.miss_rate, args.seed, args.speed)
+    noise = random.Random(args.seed)
+    frames = []
+
+    for _ in range(int(args.seconds * args.fps)):
+        scene.step(1.0 / args.fps)
+        boxes = scene.boxes()
+        frames.append((np.array([box[0] for box in boxes], dtype=np.int64),
+                       np.array([[value + noise.gauss(0, args.jitter) for value in box[1:]] for box in boxes], dtype=np.float64).reshape(-1, 4)))
+
+    return frames
+
+
+def evaluate(tracker, frames, fps):
+    """
+    Run a tracker over the frames, and score its IDs against the ground truth, as given
+    to the detections and as seen by a TrackTable (like the stream's).
+    """
+    latency = []
+    assigned = {}   # ground-truth ID => last track ID given to it
+    switches = 0
+    tracked = 0
+    detections = 0
+    track_ids = set()
+    table = TrackTable()
+    entered = []
+
+    table.subscribe(on_enter=lambda track, timestamp: entered.append(track.track_id))
+
+    for index, (truth, boxes) in enumerate(frames):
+        frame = [Box(person, *box) for person, box in zip(truth.tolist(), boxes.tolist())]
+
+        start = time.perf_counter()
+        results = tracker.Update(frame)
+        latency.append(time.perf_counter() - start)
+
+        table.update(index / fps, results)
+        detections += len(frame)
+
+        for detection in frame:
+            if detection.TrackID < 0:
+                continue
+
+            tracked += 1
+            track_ids.add(detection.TrackID)
+
+            if assigned.get(detection.person, detection.TrackID) != detection.TrackID:
+                switches += 1
+
+            assigned[detection.person] = detection.TrackID
+
+    return {
+        'latency': percentiles(latency),
+        'fps': round(len(frames) / sum(latency), 1),
+        'tracked': round(tracked / max(detections, 1), 4),
+        'id_switches': switches,
+        'tracks_per_person': round(len(track_ids) / max(len(assigned), 1), 3),
+        'entries_per_person': round(len(entered) / max(len(assigned), 1), 3),
+    }
+
+
+def main():
+    args = parser.parse_args()
+
+    fakes.install()
+    from model import IOUTracker
+
+    frames = simulate(args)
+    people = [len(truth) for truth, _ in frames]
+
+    configurations = {'greedy': {}, 'greedy+kalman': {'kalman': True}}
+
+    if importlib.util.find_spec('scipy') is not None:
+        configurations.update({'hungarian': {'matching': 'hungarian'}, 'hungarian+kalman': {'matching': 'hungarian', 'kalman': True}})
+
+    results = {
+        'frames': len(frames),
+        'people_per_frame': {'mean': round(float(np.mean(people)), 1), 'max': max(people)},
+        'trackers': {name: evaluate(IOUTracker(**options), frames, args.fps) for name, options in configurations.items()},
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{results['frames']} frames, {results['people_per_frame']['mean']} people per frame on average "
+          f"(max {results['people_per_frame']['max']})")
+
+    for name, stats in results['trackers'].items():
+        print(f"{name + ':':18s}{stats['fps']:8.1f} fps  latency {stats['latency']}  tracked {stats['tracked']:.1%}  "
+              f"ID switches {stats['id_switches']}  tracks per person {stats['tracks_per_person']}  "
+              f"entries per person {stats['entries_per_person']}")
+
+
+if __name__ == '__main__':
+    main()
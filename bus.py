@@ -0,0 +1,275 @@
+"""
+Memory-mapped analytics bus:  a stream publishes its live count, the people in
+view, the dwell statistics and the rolled-up count series into a fixed-layout
+binary file (e.g. under /dev/shm), which other processes map and read without
+copies of their own or any locking against the frame loop.
+
+The region starts with a header holding a sequence counter (a seqlock):  the
+writer makes it odd while updating and even again when done, and readers retry
+whenever it was odd or changed while they were reading.
+
+    python3 bus.py /dev/shm/v3m-stream0   # print the live state of a stream
+"""
+import os
+import sys
+import json
+import mmap
+import time
+
+import numpy as np
+
+
+MAGIC = b'V3MBUS01'
+
+DWELL_STATS = ('count', 'mean_ms', 'min_ms', 'max_ms', 'p50_ms', 'p90_ms', 'p99_ms')
+
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('sequence', '<u8'),         # odd while the writer is updating
+    ('frames', '<u8'),           # frames published
+    ('timestamp', '<f8'),        # epoch seconds of the last frame
+    ('count', '<u4'),            # people count of the last frame
+    ('tracks', '<u4'),           # number of valid entries in the track table
+    ('max_tracks', '<u4'),
+    ('resolutions', '<u4', 3),   # bucket sizes of the series rings (seconds)
+    ('capacities', '<u4', 3),    # number of buckets in each ring
+    ('written', '<u8', 3),       # buckets written to each ring so far
+    ('dwell', '<f8', len(DWELL_STATS)),
+])
+
+TRACK = np.dtype([
+    ('track_id', '<i8'),
+    ('first_seen', '<f8'),
+    ('last_seen', '<f8'),
+    ('bbox', '<f4', 4),
+])
+
+BUCKET = np.dtype([
+    ('time', '<f8'),
+    ('max', '<u2'),
+    ('min', '<u2'),
+    ('avg', '<f4'),
+])
+
+
+def layout(buffer, max_tracks, capacities):
+    """
+    Map the header, track table and series rings onto `buffer` (numpy views, no copies).
+    """
+    header = np.ndarray((), HEADER, buffer, 0)
+    offset = HEADER.itemsize
+    tracks = np.ndarray((max_tracks,), TRACK, buffer, offset)
+    offset += TRACK.itemsize * max_tracks
+    rings = []
+
+    for capacity in capacities:
+        rings.append(np.ndarray((capacity,), BUCKET, buffer, offset))
+        offset += BUCKET.itemsize * capacity
+
+    return header, tracks, rings
+
+
+def size(max_tracks, capacities):
+    return HEADER.itemsize + TRACK.itemsize * max_tracks + BUCKET.itemsize * sum(capacities)
+
+
+class AnalyticsBus:
+    """
+    Writer side of the bus, owned by a stream.
+    """
+    def __init__(self, path, max_tracks=256, resolutions=(1, 60, 3600), capacities=(3600, 1440, 720)):
+        """
+        Parameters:
+
+            path (string) -- file to map (created or replaced)
+            max_tracks (int) -- number of people published per frame (the rest are left out)
+            resolutions (tuple) -- bucket sizes of the published count series (seconds)
+            capacities (tuple) -- number of buckets kept per series (by default an hour, a day and a month)
+        """
+        self.path = path
+        self.resolutions = tuple(resolutions)
+        self.published = {resolution: 0 for resolution in self.resolutions}  # CountHistory versions copied so far
+
+        # build the region in a new file and move it into place, so readers that still
+        # map the file of a previous run keep a valid (if stale) mapping
+        temp_path = f"{path}.{os.getpid()}"
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        try:
+            os.ftruncate(fd, size(max_tracks, capacities))
+            self.mmap = mmap.mmap(fd, size(max_tracks, capacities))
+        finally:
+            os.close(fd)
+
+        self.header, self.tracks, self.rings = layout(self.mmap, max_tracks, capacities)
+        self.header['max_tracks'] = max_tracks
+        self.header['resolutions'] = self.resolutions
+        self.header['capacities'] = capacities
+        self.header['dwell'] = np.nan
+        self.header['magic'] = MAGIC
+
+        os.replace(temp_path, path)
+
+    def publish(self, timestamp, count, tracks, history, dwell=None):
+        """
+        Publish a frame:  its count, the tracks in view, the buckets that `history`
+        (a CountHistory) closed since the last call, and optionally new dwell statistics.
+        """
+        header = self.header
+        header['sequence'] += 1
+
+        try:
+            header['frames'] += 1
+            header['timestamp'] = timestamp
+            header['count'] = count
+
+            n = 0
+            table = self.tracks
+            max_tracks = len(table)
+
+            for track in tracks:
+                if n == max_tracks:
+                    break
+
+                table[n] = (track.track_id, track.first_seen, track.last_seen, track.bbox)
+                n += 1
+
+            header['tracks'] = n
+
+            for index, resolution in enumerate(self.resolutions):
+                version = history.version(resolution)
+
+                if version != self.published[resolution]:
+                    self.copy_buckets(index, history, resolution, version - self.published[resolution])
+                    self.published[resolution] = version
+
+            if dwell is not None:
+                header['dwell'] = [np.nan if dwell.get(key) is None else dwell[key] for key in DWELL_STATS]
+        finally:
+            header['sequence'] += 1
+
+    def copy_buckets(self, index, history, resolution, new):
+        ring = self.rings[index]
+        capacity = len(ring)
+        times, maxima, minima, averages = history.series(resolution=resolution, limit=min(new, capacity))
+
+        written = int(self.header['written'][index])
+        positions = np.arange(written, written + len(times)) % capacity
+
+        ring['time'][positions] = times
+        ring['max'][positions] = maxima
+        ring['min'][positions] = minima
+        ring['avg'][positions] = averages
+
+        self.header['written'][index] = written + len(times)
+
+    def close(self):
+        self.header = self.tracks = self.rings = None  # release the views, or the mmap can't be closed
+        self.mmap.close()
+
+
+class AnalyticsBusReader:
+    """
+    Reader side of the bus, usable from any process (the file is mapped read-only).
+    """
+    def __init__(self, path, retries=1000):
+        """
+        Parameters:
+
+            path (string) -- file the stream publishes to
+            retries (int) -- attempts at a consistent read before giving up
+        """
+        self.retries = retries
+
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = np.ndarray((), HEADER, self.mmap, 0)
+
+        if header['magic'] != MAGIC:
+            raise ValueError(f"{path} is not an analytics bus (or it isn't initialized yet)")
+
+        self.header, self.tracks, self.rings = layout(self.mmap, int(header['max_tracks']), header['capacities'].tolist())
+        self.resolutions = self.header['resolutions'].tolist()
+
+    def read(self, function):
+        """
+        Call `function()` until it ran while the writer was idle, and return its result.
+        """
+        header = self.header
+
+        for _ in range(self.retries):
+            sequence = int(header['sequence'])
+
+            if sequence % 2 == 0:
+                result = function()
+
+                if int(header['sequence']) == sequence:
+                    return result
+
+            time.sleep(0)
+
+        raise TimeoutError("couldn't get a consistent read of the analytics bus")
+
+    def snapshot(self):
+        """
+        Return the latest frame's count, the people in view and the dwell statistics (in ms).
+        """
+        def copy():
+            return self.header.copy(), self.tracks[:int(self.header['tracks'])].copy()
+
+        header, tracks = self.read(copy)
+
+        return {
+            'frames': int(header['frames']),
+            'timestamp': float(header['timestamp']),
+            'count': int(header['count']),
+            'tracks': [{'track_id': int(track['track_id']), 'first_seen': float(track['first_seen']),
+                        'last_seen': float(track['last_seen']), 'bbox': track['bbox'].tolist()} for track in tracks],
+            'durations': {key: None if np.isnan(value) else float(value) for key, value in zip(DWELL_STATS, header['dwell'])},
+        }
+
+    def series(self, resolution=1, since=None, limit=None):
+        """
+        Return the published buckets of `resolution` seconds newer than `since` (epoch seconds),
+        as a structured array with time, max, min and avg fields (oldest first).
+        """
+        if resolution not in self.resolutions:
+            raise ValueError(f"invalid resolution {resolution} (should be one of {', '.join(map(str, self.resolutions))})")
+
+        index = self.resolutions.index(resolution)
+        ring = self.rings[index]
+
+        def copy():
+            written = int(self.header['written'][index])
+            n = min(written, len(ring), limit if limit is not None and since is None else len(ring))
+            return ring[np.arange(written - n, written) % len(ring)]
+
+        buckets = self.read(copy)
+
+        if since is not None:
+            buckets = buckets[buckets['time'] > since]
+
+        if limit is not None:
+            buckets = buckets[-limit:] if limit > 0 else buckets[:0]
+
+        return buckets
+
+    def close(self):
+        self.header = self.tracks = self.rings = None
+        self.mmap.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(f"usage: python3 {sys.argv[0]} BUS_FILE [INTERVAL]")
+        sys.exit(1)
+
+    reader = AnalyticsBusReader(sys.argv[1])
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    while True:
+        snapshot = reader.snapshot()
+        snapshot['last_minute'] = reader.series(resolution=1, limit=60)['max'].tolist()
+        print(json.dumps(snapshot))
+        time.sleep(interval)
@@ -0,0 +1,164 @@
+import time
+import logging
+import threading
+
+from metrics import RateLimitedLogger
+from pipeline import Backoff
+from jetson_utils import videoSource
+
+
+logger = logging.getLogger(__name__)
+
+
+class SupervisedSource:
+    """
+    videoSource that reconnects by itself.  When capturing fails, the source stops streaming,
+    or no frame arrives for `stall_timeout` seconds, it's closed and reopened with exponential
+    backoff, and the stream is reported as degraded until frames come through again.
+    Capture() never raises:  it returns None while there's no frame, after waiting at most
+    about `timeout`, so a dead camera doesn't spin the CPU or flood the log.
+    """
+    def __init__(self, uri, argv=None, timeout=1000, stall_timeout=10.0, backoff=None, log_interval=10.0):
+        """
+        Parameters:
+
+            uri (string) -- the input video URI
+            argv (list) -- command-line arguments for videoSource
+            timeout (int) -- milliseconds to wait for a frame per Capture()
+            stall_timeout (float) -- seconds without a frame before the source is reopened
+            backoff (Backoff) -- delays between reconnection attempts (defaults to 1 second doubling up to a minute)
+            log_interval (float) -- seconds between repeated error messages
+        """
+        self.uri = uri
+        self.argv = argv
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.backoff = backoff or Backoff()
+        self.logger = RateLimitedLogger(logger, interval=log_interval)
+        self.lock = threading.Lock()
+        self.source = None
+        self.state = 'connecting'   # connecting, streaming or degraded
+        self.width = 0
+        self.height = 0
+        self.retry_at = 0.0         # monotonic time of the next reconnection attempt
+        self.last_frame = time.monotonic()
+        self.last_error = None
+        self.degraded_since = None
+        self.reconnects = 0
+        self.errors = {'error': 0, 'timeout': 0, 'stall': 0, 'open': 0}
+
+        self.open()
+
+    def open(self):
+        """
+        Open the source, or schedule the next attempt if it fails.
+        """
+        try:
+            self.source = videoSource(self.uri, argv=self.argv)
+        except Exception as error:
+            self.source = None
+            self.fail('open', error)
+            return False
+
+        self.width = self.source.GetWidth()
+        self.height = self.source.GetHeight()
+        self.last_frame = time.monotonic()
+        return True
+
+    def close(self):
+        source, self.source = self.source, None
+
+        if source is not None:
+            try:
+                source.Close()
+            except Exception:
+                pass
+
+    def fail(self, kind, error):
+        """
+        Record a failure, close the source, and schedule its reopening.
+        """
+        delay = self.backoff.next()
+
+        with self.lock:
+            self.errors[kind] += 1
+            self.last_error = f"{kind}: {error}"
+            self.retry_at = time.monotonic() + delay
+
+            if self.state != 'degraded':
+                self.state = 'degraded'
+                self.degraded_since = time.time()
+
+        self.close()
+        self.logger.error(kind, "input %s %s (%s), reconnecting in %.1f s", self.uri,
+                          {'open': "couldn't be opened", 'error': "failed", 'stall': "stalled"}[kind], error, delay)
+
+    def Capture(self, format='rgb8'):
+        """
+        Return the next image, or None if there is none (yet).
+        """
+        if self.source is None:
+            wait = self.retry_at - time.monotonic()
+
+            if wait > 0:
+                time.sleep(min(wait, self.timeout / 1000))
+                return None
+
+            self.reconnects += 1
+
+            if not self.open():
+                return None
+
+        try:
+            img = self.source.Capture(format=format, timeout=self.timeout)
+        except Exception as error:
+            self.fail('error', error)
+            return None
+
+        now = time.monotonic()
+
+        if img is None:
+            with self.lock:
+                self.errors['timeout'] += 1
+
+            if not self.source.IsStreaming():
+                self.fail('error', "the source stopped streaming")
+            elif now - self.last_frame > self.stall_timeout:
+                self.fail('stall', f"no frame for {now - self.last_frame:.1f} s")
+
+            return None
+
+        self.last_frame = now
+
+        if self.state != 'streaming':
+            if self.state == 'degraded':
+                logger.warning("input %s recovered after %.1f s", self.uri, time.time() - self.degraded_since)
+
+            with self.lock:
+                self.state = 'streaming'
+                self.degraded_since = None
+
+            self.backoff.reset()
+
+        return img
+
+    def GetWidth(self):
+        return self.width
+
+    def GetHeight(self):
+        return self.height
+
+    def health(self):
+        """
+        Return the state of the source (connecting, streaming or degraded) and its failure counters.
+        """
+        with self.lock:
+            return {
+                'state': self.state,
+                'degraded_since': self.degraded_since,
+                'last_frame_age': round(time.monotonic() - self.last_frame, 3),
+                'retry_in': round(max(self.retry_at - time.monotonic(), 0), 3) if self.source is None else None,
+                'reconnects': self.reconnects,
+                'errors': dict(self.errors),
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,109 @@
+import os
+import time
+import atexit
+import logging
+import threading
+
+import numpy as np
+
+from metrics import RateLimitedLogger
+
+
+logger = logging.getLogger(__name__)
+
+
+def save(path, state):
+    """
+    Write a flat dict of numpy arrays to a compressed .npz file, atomically
+    (through a temporary file), so a crash mid-write leaves the previous checkpoint.
+    """
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, 'wb') as f:
+        np.savez_compressed(f, **state)
+
+    os.replace(temp_path, path)
+
+
+def load(path):
+    """
+    Read a checkpoint written by save(), or return None if there is none (or it can't be read).
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    except Exception:
+        logger.warning("couldn't read the checkpoint %s, starting from scratch", path, exc_info=True)
+        return None
+
+
+class Checkpointer(threading.Thread):
+    """
+    Thread that saves the state returned by `get_state()` every `interval` seconds,
+    and once more when the process exits.
+    """
+    def __init__(self, path, get_state, interval=60.0):
+        """
+        Parameters:
+
+            path (string) -- path to the checkpoint file (.npz)
+            get_state (callable) -- returns the state to save, as a flat dict of numpy arrays
+            interval (float) -- seconds between checkpoints
+        """
+        super().__init__(daemon=True)
+
+        self.path = path
+        self.get_state = get_state
+        self.interval = interval
+        self.stop = threading.Event()
+        self.logger = RateLimitedLogger(logger)
+        self.lock = threading.Lock()
+        self.saved = 0
+        self.errors = 0
+        self.last_seconds = 0.0
+        self.last_bytes = 0
+
+        self.start()
+
+        atexit.register(self.close)
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """
+        Take and write a checkpoint now.
+        """
+        with self.lock:
+            start = time.perf_counter()
+
+            try:
+                save(self.path, self.get_state())
+            except Exception:
+                self.errors += 1
+                self.logger.error('save', "couldn't save the checkpoint %s", self.path, exc_info=True)
+                return
+
+            self.saved += 1
+            self.last_seconds = time.perf_counter() - start
+            self.last_bytes = os.path.getsize(self.path)
+
+    def close(self):
+        """
+        Stop the thread and write a final checkpoint.
+        """
+        if not self.stop.is_set():
+            self.stop.set()
+            self.save()
+
+    def stats(self):
+        return {
+            'saved': self.saved,
+            'errors': self.errors,
+            'last_ms': self.last_seconds * 1000,
+            'last_bytes': self.last_bytes,
+        }
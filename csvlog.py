@@ -0,0 +1,110 @@
+import os
+import gzip
+import atexit
+import shutil
+import logging
+from datetime import datetime
+
+from writer import BatchWriter
+
+
+logger = logging.getLogger(__name__)
+
+
+class CSVLogger(BatchWriter):
+    """
+    Thread that appends rows to a CSV file in batches, off the frame loop (an existing file is appended to).
+    Rows are queued in memory and flushed by batch size or interval, and the
+    file can be rotated daily or by size (optionally gzip-compressed).
+    If the disk can't keep up and the queue fills, new rows are dropped and counted.
+    """
+    def __init__(self, path, header, flush_interval=1.0, batch_size=500, queue_size=10000, rotate='none', max_size=100, compress=False):
+        """
+        Open the log and start the writer thread.
+
+        Parameters:
+
+            path (string) -- path to the CSV file
+            header (string) -- the CSV header line written at the top of each file
+            flush_interval (float) -- seconds to wait for a batch to fill before writing it anyway
+            batch_size (int) -- number of rows written per flush at most
+            queue_size (int) -- number of rows that can be pending before new ones are dropped
+            rotate (string) -- 'none', 'daily' or 'size'
+            max_size (float) -- size in MB after which the file is rotated (with rotate='size')
+            compress (bool) -- gzip rotated files
+        """
+        if rotate not in ('none', 'daily', 'size'):
+            raise ValueError(f"invalid log rotation '{rotate}' (should be 'none', 'daily' or 'size')")
+
+        super().__init__(path, logger, flush_interval=flush_interval, batch_size=batch_size, queue_size=queue_size)
+
+        self.header = header
+        self.rotate = rotate
+        self.max_size = max_size * 1024 * 1024
+        self.compress = compress
+        self.day = datetime.now().date()
+
+        # append to the log of a previous run, only starting new files with the header
+        if not os.path.exists(path) or not os.path.getsize(path):
+            self.write_header("w")
+
+        self.start()
+
+        atexit.register(self.close)
+
+    def write(self, *values):
+        """
+        Queue a row for writing.  Never blocks; returns False if the row was dropped.
+        """
+        return self.put(values)
+
+    def write_batch(self, rows):
+        """
+        Write a batch of rows, rotating the file first if needed.
+        """
+        lines = []
+
+        for row in rows:
+            if self.rotate == 'daily' and row[0].date() != self.day:
+                self.write_lines(lines)
+                self.rotate_file(self.day.isoformat())
+                self.day = row[0].date()
+                lines = []
+
+            lines.append(','.join(map(str, row)) + '\n')
+
+        self.write_lines(lines)
+
+        if self.rotate == 'size' and os.path.getsize(self.path) >= self.max_size:
+            self.rotate_file(datetime.now().strftime('%Y%m%d-%H%M%S'))
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+
+        with open(self.path, "a") as f:
+            f.writelines(lines)
+
+    def write_header(self, mode):
+        with open(self.path, mode) as f:
+            f.write(self.header + '\n')
+
+    def rotate_file(self, suffix):
+        """
+        Move the current file aside as <name>.<suffix><ext> and start a new one.
+        """
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}.{suffix}{ext}"
+        index = 1
+
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            rotated = f"{root}.{suffix}-{index}{ext}"
+            index += 1
+
+        os.replace(self.path, rotated)
+        self.write_header("w")
+
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
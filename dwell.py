@@ -0,0 +1,192 @@
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Fixed-size, mergeable quantile sketch (a log-bucketed histogram, as in DDSketch).
+    Values are counted in buckets whose bounds grow geometrically, so any quantile
+    is returned within `accuracy` relative error, and two sketches merge by adding counts.
+    """
+    def __init__(self, accuracy=0.01, min_value=1.0, max_value=86400000.0):
+        """
+        Parameters:
+
+            accuracy (float) -- relative error of the quantiles
+            min_value, max_value (float) -- the range of values tracked (values outside it are clamped)
+        """
+        self.accuracy = accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = math.floor(math.log(min_value) / self.log_gamma)
+        self.counts = np.zeros(math.ceil(math.log(max_value) / self.log_gamma) - self.offset + 1, dtype=np.uint32)
+        self.count = 0
+
+    def add(self, value):
+        value = min(max(value, self.min_value), self.max_value)
+        self.counts[math.ceil(math.log(value) / self.log_gamma) - self.offset] += 1
+        self.count += 1
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+
+    def copy(self):
+        sketch = QuantileSketch(self.accuracy, self.min_value, self.max_value)
+        sketch.merge(self)
+        return sketch
+
+    def quantile(self, q):
+        """
+        Return the q-quantile (0-1) of the values added, or None if there are none.
+        """
+        if not self.count:
+            return None
+
+        rank = math.floor(q * (self.count - 1))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side='right'))
+        return 2 * self.gamma ** (index + self.offset) / (self.gamma + 1)
+
+
+class DwellStats:
+    """
+    Incrementally maintained dwell-time aggregates: count, mean, min/max and percentiles.
+    """
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, accuracy=0.01):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.sketch = QuantileSketch(accuracy)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.sketch.add(duration)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def copy(self):
+        stats = DwellStats(self.sketch.accuracy)
+        stats.merge(self)
+        return stats
+
+    def as_dict(self):
+        stats = {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else None,
+            'min_ms': self.min if self.count else None,
+            'max_ms': self.max if self.count else None,
+        }
+
+        for q in self.QUANTILES:
+            stats[f"p{round(q * 100)}_ms"] = self.sketch.quantile(q)
+
+        return stats
+
+
+class DwellHistory:
+    """
+    Dwell times of the people that left the frame, as all-time aggregates plus
+    time slices (hourly by default) that can be merged to answer per-window queries.
+    Memory use is fixed, whatever the number of people that passed through.
+    """
+    def __init__(self, accuracy=0.01, slice_seconds=3600, retention=604800):
+        """
+        Parameters:
+
+            accuracy (float) -- relative error of the percentiles
+            slice_seconds (int) -- length of the time slices
+            retention (int) -- how long to keep the time slices (in seconds)
+        """
+        self.accuracy = accuracy
+        self.slice_seconds = slice_seconds
+        self.total = DwellStats(accuracy)
+        self.slices = deque(maxlen=max(1, retention // slice_seconds))  # (start time, DwellStats)
+        self.lock = threading.Lock()
+
+    def add(self, timestamp, duration):
+        """
+        Record the dwell time (in ms) of a person that left at `timestamp` (epoch seconds).
+        """
+        start = timestamp - timestamp % self.slice_seconds
+
+        with self.lock:
+            if not self.slices or self.slices[-1][0] != start:
+                self.slices.append((start, DwellStats(self.accuracy)))
+
+            self.slices[-1][1].add(duration)
+            self.total.add(duration)
+
+    def stats(self, window=None, now=None, current=()):
+        """
+        Return the aggregates over all time, or over the slices overlapping the last
+        `window` seconds, including the `current` (in-progress) dwell times if given.
+        """
+        with self.lock:
+            if window is None:
+                stats = self.total.copy()
+            else:
+                since = now - window
+                stats = DwellStats(self.accuracy)
+
+                for start, part in self.slices:
+                    if start + self.slice_seconds > since:
+                        stats.merge(part)
+
+        for duration in current:
+            stats.add(duration)
+
+        return stats.as_dict()
+
+    def get_state(self):
+        """
+        Return the aggregates of all time and of each slice as numpy arrays (for checkpoints).
+        """
+        with self.lock:
+            parts = [(0.0, self.total)] + list(self.slices)
+
+            return {
+                'accuracy': np.array(self.accuracy),
+                'starts': np.array([start for start, _ in parts], dtype=np.float64),
+                'aggregates': np.array([(stats.count, stats.total, stats.min, stats.max) for _, stats in parts], dtype=np.float64),
+                'sketches': np.stack([stats.sketch.counts for _, stats in parts]),
+            }
+
+    def set_state(self, state):
+        """
+        Restore the state saved by get_state() (raises ValueError if the accuracy changed since).
+        """
+        if float(state['accuracy']) != self.accuracy:
+            raise ValueError(f"the dwell times were saved with accuracy {float(state['accuracy'])}, not {self.accuracy}")
+
+        parts = []
+
+        for start, (count, total, minimum, maximum), counts in zip(state['starts'].tolist(), state['aggregates'].tolist(), state['sketches']):
+            stats = DwellStats(self.accuracy)
+            stats.count = int(count)
+            stats.total = total
+            stats.min = minimum
+            stats.max = maximum
+            stats.sketch.counts[:] = counts
+            stats.sketch.count = int(count)
+            parts.append((start, stats))
+
+        with self.lock:
+            self.total = parts[0][1]
+            self.slices.clear()
+            self.slices.extend(parts[1:])
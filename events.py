@@ -0,0 +1,57 @@
+import json
+import threading
+
+
+class EventBroadcaster:
+    """
+    Pushes the latest message to any number of Server-Sent Events subscribers.
+    Each message is JSON-encoded once when published, whatever the number of
+    subscribers, and slow subscribers simply skip to the newest message.
+    """
+    def __init__(self, keepalive=15.0):
+        """
+        Parameters:
+
+            keepalive (float) -- seconds after which an idle subscriber gets a comment line, so proxies keep the connection open
+        """
+        self.keepalive = keepalive
+        self.condition = threading.Condition()
+        self.message = None
+        self.sequence = 0
+        self.subscribers = 0
+
+    def publish(self, data):
+        """
+        Encode `data` as JSON and wake up the subscribers.
+        """
+        message = f"data: {json.dumps(data)}\n\n"
+
+        with self.condition:
+            self.message = message
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def subscribe(self):
+        """
+        Generator of SSE messages for one client, starting with the latest one.
+        """
+        with self.condition:
+            self.subscribers += 1
+
+        try:
+            sequence = 0
+
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.sequence != sequence, timeout=self.keepalive)
+
+                    if self.sequence == sequence:
+                        message = ": keepalive\n\n"
+                    else:
+                        sequence = self.sequence
+                        message = self.message
+
+                yield message
+        finally:
+            with self.condition:
+                self.subscribers -= 1
@@ -161,4 +161,4 @@ if args.ssl_cert and args.ssl_key:
     ssl_context = (args.ssl_cert, args.ssl_key)
     
 # start the webserver
-app.run(host=args.host, port=args.port, ssl_context=ssl_context, debug=True, use_reloader=False)
\ No newline at end of file
+app.run(host=args.host, port=args.port, ssl_context=ssl_context, threaded=True, use_reloader=False)
\ No newline at end of file
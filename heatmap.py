@@ -0,0 +1,161 @@
+import gzip
+import json
+import time
+import zlib
+import struct
+import threading
+
+import numpy as np
+
+
+# colormap stops of the PNG tiles:  position (0-1), red, green, blue, alpha
+COLORMAP = np.array([
+    (0.0,    0,   0, 255,   0),
+    (0.25,   0, 255, 255, 120),
+    (0.5,    0, 255,   0, 160),
+    (0.75, 255, 255,   0, 200),
+    (1.0,  255,   0,   0, 230),
+])
+
+LUT = np.stack([np.interp(np.linspace(0, 1, 256), COLORMAP[:, 0], COLORMAP[:, channel]) for channel in range(1, 5)], axis=1).astype(np.uint8)
+
+
+def encode_png(rgba):
+    """
+    Encode an RGBA image (rows x cols x 4 uint8 array) as PNG bytes.
+    """
+    height, width, _ = rgba.shape
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1)  # filter type 0 per row
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+class OccupancyHeatmap:
+    """
+    Where people stand:  the foot points (bottom centre of the boxes) of the people detected,
+    accumulated as person-seconds into a fixed-resolution grid, in time slices (hourly by
+    default) that are summed to answer per-window queries.  The slices are a ring indexed by
+    time, so memory use is fixed.  The rendered tiles are cached for `interval` seconds,
+    so they are encoded at most once per interval, whatever the number of requests.
+    """
+    def __init__(self, cols=64, rows=36, slice_seconds=3600, retention=86400, interval=10.0, max_gap=1.0):
+        """
+        Parameters:
+
+            cols, rows (int) -- resolution of the grid the frame is divided into
+            slice_seconds (int) -- length of the time slices
+            retention (int) -- how long to keep the time slices (in seconds)
+            interval (float) -- seconds the rendered tiles are cached for
+            max_gap (float) -- the most a frame counts for (in seconds), so gaps in the video aren't counted as presence
+        """
+        self.cols = cols
+        self.rows = rows
+        self.slice_seconds = slice_seconds
+        self.interval = interval
+        self.max_gap = max_gap
+        self.slices = np.zeros((max(1, retention // slice_seconds), rows, cols), dtype=np.float32)
+        self.starts = np.full(len(self.slices), np.nan)  # start time of each slice (NaN if unused)
+        self.last = None      # timestamp of the previous frame
+        self.lock = threading.Lock()
+        self.cache = {}       # (window, format) => [expiry, tile, gzipped tile (or None until requested)]
+        self.cache_lock = threading.Lock()
+        self.renders = 0
+
+    def add(self, timestamp, detections, width, height):
+        """
+        Add the foot points of a frame's detections (at `timestamp`, in epoch seconds) in a
+        `width` x `height` frame, each weighted by the time since the previous frame.
+        """
+        weight = 0.0 if self.last is None else min(max(timestamp - self.last, 0.0), self.max_gap)
+        self.last = timestamp
+
+        if not detections or not weight:
+            return
+
+        points = np.array([((detection.Left + detection.Right) / 2, detection.Bottom) for detection in detections], dtype=np.float32)
+        cells = (points * (self.cols / width, self.rows / height)).astype(np.intp)
+        np.clip(cells, 0, (self.cols - 1, self.rows - 1), out=cells)
+
+        start = timestamp - timestamp % self.slice_seconds
+        index = int(start // self.slice_seconds) % len(self.slices)
+
+        with self.lock:
+            if self.starts[index] != start:
+                self.slices[index] = 0
+                self.starts[index] = start
+
+            np.add.at(self.slices[index], (cells[:, 1], cells[:, 0]), weight)
+
+    def grid(self, window=None):
+        """
+        Return the person-seconds per cell over all the slices kept, or over the slices
+        overlapping the last `window` seconds.
+        """
+        with self.lock:
+            used = ~np.isnan(self.starts)
+
+            if self.last is not None:
+                span = len(self.slices) * self.slice_seconds if window is None else window
+                used &= self.starts + self.slice_seconds > self.last - span
+
+            return self.slices[used].sum(axis=0)
+
+    def tile(self, window=None, format='png', gzipped=False):
+        """
+        Return the heatmap as PNG bytes (square-root scaled to the busiest cell) or as JSON bytes,
+        re-rendered at most every `interval` seconds (so cached requests skip the serialization too).
+        With `gzipped`, the tile is returned gzip-compressed, which is cached along with it.
+        """
+        if format not in ('png', 'json'):
+            raise ValueError(f"invalid heatmap format '{format}' (should be png or json)")
+
+        key = (window, format)
+        now = time.monotonic()
+
+        with self.cache_lock:
+            cached = self.cache.get(key)
+
+            if cached is not None and cached[0] > now:
+                if gzipped and cached[2] is None:
+                    cached[2] = gzip.compress(cached[1], compresslevel=5)
+
+                return cached[2] if gzipped else cached[1]
+
+            grid = self.grid(window)
+            peak = float(grid.max()) if grid.size else 0.0
+
+            if format == 'png':
+                levels = np.sqrt(grid / peak) * 255 if peak else grid
+                tile = encode_png(LUT[levels.astype(np.uint8)])
+            else:
+                tile = json.dumps({'cols': self.cols, 'rows': self.rows, 'window': window, 'slice_seconds': self.slice_seconds,
+                                   'max': round(peak, 1), 'grid': grid.round(1).tolist()}, separators=(',', ':')).encode()
+
+            if len(self.cache) >= 16:
+                self.cache.clear()
+
+            cached = self.cache[key] = [now + self.interval, tile, gzip.compress(tile, compresslevel=5) if gzipped else None]
+            self.renders += 1
+            return cached[2] if gzipped else tile
+
+    def get_state(self):
+        """
+        Return the time slices as numpy arrays (for checkpoints).
+        """
+        with self.lock:
+            return {'slices': self.slices.copy(), 'starts': self.starts.copy()}
+
+    def set_state(self, state):
+        """
+        Restore the slices saved by get_state() (raises ValueError if the grid or slices changed since).
+        """
+        if state['slices'].shape != self.slices.shape:
+            raise ValueError(f"the heatmap was saved as {state['slices'].shape} slices x rows x cols, not {self.slices.shape}")
+
+        with self.lock:
+            self.slices[:] = state['slices']
+            self.starts[:] = state['starts']
@@ -0,0 +1,249 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity ring of timestamped numeric samples, stored column-wise in numpy arrays.
+    Once full, the oldest samples are overwritten, so memory use is independent of uptime.
+    """
+    def __init__(self, capacity, columns=None):
+        """
+        Allocate the ring.
+
+        Parameters:
+
+            capacity (int) -- the maximum number of samples retained
+            columns (dict) -- column name => numpy dtype, stored alongside the float64 epoch timestamps
+        """
+        if columns is None:
+            columns = {'value': np.float32}
+
+        self.capacity = int(capacity)
+        self.written = 0
+        self.times = np.zeros(self.capacity, dtype=np.float64)
+        self.columns = {name: np.zeros(self.capacity, dtype=dtype) for name, dtype in columns.items()}
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    def append(self, timestamp, **values):
+        """
+        Append one sample, overwriting the oldest one if the ring is full.
+        """
+        index = self.written % self.capacity
+        self.times[index] = timestamp
+
+        for name, value in values.items():
+            self.columns[name][index] = value
+
+        self.written += 1
+
+    def last(self):
+        """
+        Return the newest sample as (timestamp, {column: value}), or None if empty.
+        """
+        if not self.written:
+            return None
+
+        index = (self.written - 1) % self.capacity
+        return self.times[index], {name: column[index] for name, column in self.columns.items()}
+
+    def query(self, since=None, limit=None):
+        """
+        Return (times, {column: values}) for the samples newer than `since`,
+        optionally only the last `limit` of them.  Cost is proportional to the
+        number of samples returned, not to the size of the ring.
+        """
+        length = len(self)
+        oldest = (self.written - length) % self.capacity
+        start = 0 if since is None else self._search(since, oldest, length)
+
+        if limit is not None:
+            start = max(start, length - limit)
+
+        indices = (oldest + np.arange(start, length)) % self.capacity
+        return self.times[indices], {name: column[indices] for name, column in self.columns.items()}
+
+    def get_state(self, prefix=''):
+        """
+        Return the samples (oldest first) and the write counter as numpy arrays, keyed by `prefix` + name.
+        """
+        times, columns = self.query()
+        state = {prefix + 'written': np.array(self.written), prefix + 'times': times}
+        state.update({prefix + name: values for name, values in columns.items()})
+        return state
+
+    def set_state(self, state, prefix=''):
+        """
+        Restore the samples saved by get_state() (the newest ones, if they don't all fit anymore).
+        """
+        times = state[prefix + 'times'][-self.capacity:]
+        written = int(state[prefix + 'written'])
+
+        # with a larger capacity than when saved, the ring isn't full, so it must start at 0
+        if len(times) < self.capacity:
+            written = len(times)
+
+        indices = (written - len(times) + np.arange(len(times))) % self.capacity
+
+        self.times[indices] = times
+
+        for name, column in self.columns.items():
+            column[indices] = state[prefix + name][-self.capacity:]
+
+        self.written = written
+
+    def _search(self, timestamp, oldest, length):
+        """
+        Logical index of the first sample newer than `timestamp`.  The ring holds at
+        most two sorted runs ([oldest:] and [:oldest]), so bisect whichever applies.
+        """
+        if length < self.capacity or oldest == 0:
+            return int(np.searchsorted(self.times[:length], timestamp, side='right'))
+
+        head = self.times[oldest:]
+
+        if timestamp < head[-1]:
+            return int(np.searchsorted(head, timestamp, side='right'))
+
+        return len(head) + int(np.searchsorted(self.times[:oldest], timestamp, side='right'))
+
+
+class CountHistory:
+    """
+    Bounded history of the per-frame people count: raw samples plus tiered
+    max/min/avg rollups (1 second -> 1 minute -> 1 hour), each tier in its own ring.
+    """
+    RESOLUTIONS = (1, 60, 3600)
+
+    def __init__(self, raw_capacity=18000, retention=(86400, 2592000, 31536000)):
+        """
+        Parameters:
+
+            raw_capacity (int) -- number of raw per-frame samples to keep
+            retention (tuple) -- how long to keep the 1s, 1m and 1h rollups (in seconds)
+        """
+        self.lock = threading.Lock()
+        self.raw = RingBuffer(raw_capacity, {'count': np.uint16})
+        self.tiers = {
+            resolution: RingBuffer(max(1, keep // resolution), {'max': np.uint16, 'min': np.uint16, 'sum': np.uint32, 'samples': np.uint32})
+            for resolution, keep in zip(self.RESOLUTIONS, retention)
+        }
+        self.buckets = {resolution: None for resolution in self.tiers}  # open bucket per tier: [start, max, min, sum, samples]
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes + sum(tier.nbytes for tier in self.tiers.values())
+
+    def add(self, timestamp, count):
+        """
+        Record the count of one frame at `timestamp` (epoch seconds).
+        """
+        with self.lock:
+            self.raw.append(timestamp, count=count)
+            self._fold(self.RESOLUTIONS[0], timestamp, count, count, count, 1)
+
+    def _fold(self, resolution, timestamp, max_count, min_count, total, samples):
+        """
+        Fold a sample (or a closed bucket of the tier below) into the open bucket of
+        `resolution`, closing it into the ring and cascading upwards when a new bucket starts.
+        """
+        if resolution not in self.tiers:
+            return
+
+        start = timestamp - timestamp % resolution
+        bucket = self.buckets[resolution]
+
+        if bucket is not None and bucket[0] != start:
+            self.tiers[resolution].append(bucket[0], max=bucket[1], min=bucket[2], sum=bucket[3], samples=bucket[4])
+            self._fold_next(resolution, bucket)
+            bucket = None
+
+        if bucket is None:
+            self.buckets[resolution] = [start, max_count, min_count, total, samples]
+        else:
+            bucket[1] = max(bucket[1], max_count)
+            bucket[2] = min(bucket[2], min_count)
+            bucket[3] += total
+            bucket[4] += samples
+
+    def _fold_next(self, resolution, bucket):
+        index = self.RESOLUTIONS.index(resolution) + 1
+
+        if index < len(self.RESOLUTIONS):
+            self._fold(self.RESOLUTIONS[index], *bucket)
+
+    def get_state(self):
+        """
+        Return the raw samples, the rollups and the open buckets as numpy arrays (for checkpoints).
+        """
+        with self.lock:
+            state = self.raw.get_state('raw.')
+
+            for resolution, tier in self.tiers.items():
+                state.update(tier.get_state(f"{resolution}."))
+
+            state['buckets'] = np.array([bucket if bucket is not None else [np.nan] * 5 for bucket in self.buckets.values()], dtype=np.float64)
+
+        return state
+
+    def set_state(self, state):
+        """
+        Restore the state saved by get_state().
+        """
+        with self.lock:
+            self.raw.set_state(state, 'raw.')
+
+            for resolution, tier in self.tiers.items():
+                tier.set_state(state, f"{resolution}.")
+
+            for resolution, bucket in zip(self.tiers, state['buckets'].tolist()):
+                self.buckets[resolution] = None if np.isnan(bucket[0]) else [bucket[0]] + [int(value) for value in bucket[1:]]
+
+    def version(self, resolution=1):
+        """
+        Return the number of buckets closed so far at `resolution`, which changes
+        whenever the series does (used for the ETags of /data).
+        """
+        if resolution not in self.tiers:
+            raise ValueError(f"invalid resolution {resolution} (should be one of {', '.join(map(str, self.tiers))})")
+
+        return self.tiers[resolution].written
+
+    def rows(self, resolution=1, limit=None):
+        """
+        Return the last `limit` closed buckets of `resolution` seconds as
+        (start time, max, min, sum, samples) tuples of ints.
+        """
+        with self.lock:
+            times, columns = self.tiers[resolution].query(limit=limit)
+
+        return list(zip(times.astype(int).tolist(), columns['max'].tolist(), columns['min'].tolist(),
+                        columns['sum'].tolist(), columns['samples'].tolist()))
+
+    def last_count(self):
+        """
+        Return the most recent per-frame count (0 if nothing was recorded yet).
+        """
+        sample = self.raw.last()
+        return int(sample[1]['count']) if sample else 0
+
+    def series(self, resolution=1, since=None, limit=None):
+        """
+        Return the closed buckets of `resolution` seconds newer than `since` (epoch seconds)
+        as (start times, max, min, avg) arrays.
+        """
+        if resolution not in self.tiers:
+            raise ValueError(f"invalid resolution {resolution} (should be one of {', '.join(map(str, self.tiers))})")
+
+        with self.lock:
+            times, columns = self.tiers[resolution].query(since=since, limit=limit)
+
+        return times, columns['max'], columns['min'], columns['sum'] / np.maximum(columns['samples'], 1)
+
@@ -0,0 +1,239 @@
+import os
+import json
+import threading
+
+import numpy as np
+
+from history import RingBuffer
+
+
+class CountingLines:
+    """
+    Virtual counting lines for footfall.  Every frame, the step each track's foot point
+    (the bottom centre of its box) made since the previous frame is tested against all
+    the lines at once (a vectorized segment intersection over tracks x lines), and the
+    crossings are counted per direction, cumulatively and per minute.
+
+    A line goes from point a to point b.  Crossing it from the right-hand side of a -> b
+    to the left-hand side counts as 'in', the other way as 'out'; so for a horizontal
+    line drawn left to right, moving up the image is 'in'.  Swap the points to swap them.
+    """
+    def __init__(self, lines=None, retention=604800):
+        """
+        Parameters:
+
+            lines (list) -- the lines, as {"name": "door", "line": [[x1, y1], [x2, y2]]} or just [[x1, y1], [x2, y2]] (pixels)
+            retention (int) -- how long to keep the per-minute counts (in seconds)
+        """
+        self.capacity = max(1, retention // 60)
+        self.lock = threading.Lock()
+        self.positions = {}  # track ID => foot point in the previous frame
+        self.names = []
+        self.bucket_start = None  # start of the current minute
+        self.set_lines(lines or [])
+
+    @staticmethod
+    def load(config='', retention=604800):
+        """
+        Create the counting lines from a JSON string or a path to a JSON file (empty for none).
+        """
+        if config and os.path.isfile(config):
+            with open(config) as f:
+                config = f.read()
+
+        return CountingLines(json.loads(config) if config else [], retention)
+
+    def __bool__(self):
+        return bool(self.names)
+
+    def get_lines(self):
+        with self.lock:
+            return [{'name': name, 'line': [a, b]} for name, a, b in zip(self.names, self.a.tolist(), self.b.tolist())]
+
+    def set_lines(self, lines):
+        """
+        Replace the lines.  The counts of the lines that keep their name are kept.
+        Raises ValueError if the lines are invalid.
+        """
+        if not isinstance(lines, list):
+            raise ValueError("the counting lines should be a list")
+
+        names, points = [], []
+
+        for index, entry in enumerate(lines):
+            if isinstance(entry, dict):
+                name, line = str(entry.get('name', f"line{index}")), entry.get('line')
+            else:
+                name, line = f"line{index}", entry
+
+            try:
+                line = np.array(line, dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid counting line {entry} (should be [[x1, y1], [x2, y2]])")
+
+            if line.shape != (2, 2) or line[0].tolist() == line[1].tolist():
+                raise ValueError(f"invalid counting line {entry} (should be [[x1, y1], [x2, y2]], with different points)")
+
+            if name in names:
+                raise ValueError(f"duplicate counting line name '{name}'")
+
+            names.append(name)
+            points.append(line)
+
+        points = np.array(points, dtype=np.float64).reshape(-1, 2, 2)
+
+        with self.lock:
+            previous = {name: index for index, name in enumerate(self.names)}
+            totals = np.zeros((len(names), 2), dtype=np.int64)    # per line: in, out
+            bucket = np.zeros((len(names), 2), dtype=np.int64)    # counts of the current minute
+            series = {}
+
+            for index, name in enumerate(names):
+                if name in previous:
+                    totals[index] = self.totals[previous[name]]
+                    bucket[index] = self.bucket[previous[name]]
+                    series[name] = self.series[name]
+                else:
+                    series[name] = RingBuffer(self.capacity, {'in': np.uint32, 'out': np.uint32})
+
+            self.names = names
+            self.a = points[:, 0]
+            self.b = points[:, 1]
+            self.totals = totals
+            self.bucket = bucket
+            self.series = series
+
+    def update(self, timestamp, tracks):
+        """
+        Count the lines crossed by the tracks (tracks.Track) since the previous frame.
+        """
+        ids, points = [], []
+
+        for track in tracks:
+            left, top, right, bottom = track.bbox
+            ids.append(track.track_id)
+            points.append(((left + right) / 2, bottom))
+
+        previous = self.positions
+        self.positions = dict(zip(ids, points))
+        moved = [(previous[track_id], point) for track_id, point in zip(ids, points) if track_id in previous]
+
+        with self.lock:
+            self.roll(timestamp)
+
+            if not moved or not self.names:
+                return
+
+            steps = np.array(moved, dtype=np.float64)
+            entering, leaving = self.crossings(steps[:, 0], steps[:, 1], self.a, self.b)
+            counts = np.stack([entering.sum(axis=0), leaving.sum(axis=0)], axis=1)
+
+            self.totals += counts
+            self.bucket += counts
+
+    @staticmethod
+    def crossings(p, q, a, b):
+        """
+        Test the steps p -> q (M x 2) against the lines a -> b (L x 2).
+        Returns two M x L boolean arrays:  the steps crossing each line inwards, and outwards.
+        """
+        direction = b - a
+        step = q - p
+
+        # side of the lines the steps start and end on (> 0 is the right-hand side, as y points down)
+        side_p = direction[:, 0] * (p[:, None, 1] - a[:, 1]) - direction[:, 1] * (p[:, None, 0] - a[:, 0])
+        side_q = direction[:, 0] * (q[:, None, 1] - a[:, 1]) - direction[:, 1] * (q[:, None, 0] - a[:, 0])
+
+        # side of the steps the ends of the lines are on
+        side_a = step[:, None, 0] * (a[:, 1] - p[:, None, 1]) - step[:, None, 1] * (a[:, 0] - p[:, None, 0])
+        side_b = step[:, None, 0] * (b[:, 1] - p[:, None, 1]) - step[:, None, 1] * (b[:, 0] - p[:, None, 0])
+
+        within = side_a * side_b < 0
+        return within & (side_p > 0) & (side_q <= 0), within & (side_p < 0) & (side_q >= 0)
+
+    def roll(self, timestamp):
+        """
+        Close the current minute into the per-minute series when a new one starts.
+        """
+        start = timestamp - timestamp % 60
+
+        if self.bucket_start is None:
+            self.bucket_start = start
+        elif start != self.bucket_start:
+            for name, counts in zip(self.names, self.bucket.tolist()):
+                self.series[name].append(self.bucket_start, **{'in': counts[0], 'out': counts[1]})
+
+            self.bucket[:] = 0
+            self.bucket_start = start
+
+    def footfall(self, since=None, limit=None, resolution=60):
+        """
+        Return the total in/out counts per line, the occupancy (in - out over all lines),
+        and the per-line series of closed minutes (or hours) as [[epoch ms, in, out], ...].
+        """
+        if resolution not in (60, 3600):
+            raise ValueError(f"invalid resolution {resolution} (should be 60 or 3600)")
+
+        with self.lock:
+            names = self.names
+            totals = self.totals.tolist()
+            series = {name: self.series[name].query(since, limit) if resolution == 60 else self.series[name].query() for name in names}
+
+        history = {}
+
+        for name, (times, columns) in series.items():
+            counts = np.stack([columns['in'], columns['out']], axis=1).astype(np.int64)
+
+            if resolution == 3600 and len(times):
+                hours = times - times % 3600
+                starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+                times, counts = hours[starts], np.add.reduceat(counts, starts)
+
+                if since is not None:
+                    times, counts = times[times > since], counts[times > since]
+
+                if limit is not None:
+                    times, counts = times[max(0, len(times) - limit):], counts[max(0, len(counts) - limit):]
+
+            history[name] = [[int(time * 1000)] + count for time, count in zip(times.tolist(), counts.tolist())]
+
+        return {
+            'lines': {name: {'in': total[0], 'out': total[1]} for name, total in zip(names, totals)},
+            'occupancy': max(0, sum(total[0] - total[1] for total in totals)),
+            'history': history,
+        }
+
+    def get_state(self):
+        """
+        Return the counts of the lines as numpy arrays (for checkpoints).
+        """
+        with self.lock:
+            state = {
+                'names': np.array(self.names, dtype=str),
+                'totals': self.totals.copy(),
+                'bucket': self.bucket.copy(),
+                'bucket_start': np.array(np.nan if self.bucket_start is None else self.bucket_start),
+            }
+
+            for index, name in enumerate(self.names):
+                state.update(self.series[name].get_state(f"{index}."))
+
+        return state
+
+    def set_state(self, state):
+        """
+        Restore the counts saved by get_state() of the lines that still exist (by name).
+        """
+        with self.lock:
+            current = {name: index for index, name in enumerate(self.names)}
+
+            for saved, name in enumerate(state['names'].tolist()):
+                if name not in current:
+                    continue
+
+                self.totals[current[name]] = state['totals'][saved]
+                self.bucket[current[name]] = state['bucket'][saved]
+                self.series[name].set_state(state, f"{saved}.")
+
+            if not np.isnan(state['bucket_start']):
+                self.bucket_start = float(state['bucket_start'])
@@ -0,0 +1,116 @@
+import time
+import logging
+import threading
+
+
+class MetricsWriter:
+    """
+    Builds a Prometheus text exposition (version 0.0.4).  Samples can be added in
+    any order; they are grouped per metric under its HELP/TYPE lines when written.
+    """
+    def __init__(self, prefix='v3m_'):
+        self.prefix = prefix
+        self.metrics = {}  # name => (type, help, [lines])
+
+    def metric(self, name, type, help):
+        name = self.prefix + name
+
+        if name not in self.metrics:
+            self.metrics[name] = (type, help, [])
+
+        return name, self.metrics[name][2]
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+
+        return '{' + ','.join(f'{key}="{MetricsWriter.escape(value)}"' for key, value in labels.items()) + '}'
+
+    @staticmethod
+    def escape(value):
+        """
+        Escape a label value as the exposition format requires (backslashes, double quotes and newlines).
+        """
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def gauge(self, name, help, value, **labels):
+        name, lines = self.metric(name, 'gauge', help)
+        lines.append(f"{name}{self.format_labels(labels)} {float(value)}")
+
+    def counter(self, name, help, value, **labels):
+        name, lines = self.metric(name, 'counter', help)
+        lines.append(f"{name}{self.format_labels(labels)} {float(value)}")
+
+    def histogram(self, name, help, stats, **labels):
+        """
+        Add a histogram from a pipeline.StageStats (cumulative bucket counts, sum and count).
+        """
+        name, lines = self.metric(name, 'histogram', help)
+        cumulative = 0
+
+        for bound, count in zip(stats.BUCKETS + ('+Inf',), list(stats.buckets)):
+            cumulative += count
+            lines.append(f"{name}_bucket{self.format_labels(dict(labels, le=bound))} {cumulative}")
+
+        lines.append(f"{name}_sum{self.format_labels(labels)} {stats.sum}")
+        lines.append(f"{name}_count{self.format_labels(labels)} {cumulative}")
+
+    def text(self):
+        output = []
+
+        for name, (type, help, lines) in self.metrics.items():
+            output.append(f"# HELP {name} {help}")
+            output.append(f"# TYPE {name} {type}")
+            output.extend(lines)
+
+        return '\n'.join(output) + '\n'
+
+
+class RateLimitedLogger:
+    """
+    Wraps a logger so that each message key is logged at most once per interval.
+    The number of suppressed messages is appended to the next one that gets through.
+    """
+    def __init__(self, logger, interval=10.0):
+        self.logger = logger
+        self.interval = interval
+        self.last = {}        # key => time it was last logged
+        self.suppressed = {}  # key => messages suppressed since
+        self.lock = threading.Lock()
+
+    def log(self, level, key, msg, *args, **kwargs):
+        """
+        Log `msg % args` at `level`, unless `key` was already logged within the interval.
+        Returns True if the message was logged.
+        """
+        if not self.logger.isEnabledFor(level):
+            return False
+
+        now = time.monotonic()
+
+        with self.lock:
+            if now - self.last.get(key, -self.interval) < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+
+            self.last[key] = now
+            suppressed = self.suppressed.pop(key, 0)
+
+        if suppressed:
+            msg += f" ({suppressed} similar messages suppressed)"
+
+        self.logger.log(level, msg, *args, **kwargs)
+        return True
+
+    def debug(self, key, msg, *args, **kwargs):
+        return self.log(logging.DEBUG, key, msg, *args, **kwargs)
+
+    def info(self, key, msg, *args, **kwargs):
+        return self.log(logging.INFO, key, msg, *args, **kwargs)
+
+    def warning(self, key, msg, *args, **kwargs):
+        return self.log(logging.WARNING, key, msg, *args, **kwargs)
+
+    def error(self, key, msg, *args, **kwargs):
+        return self.log(logging.ERROR, key, msg, *args, **kwargs)
@@ -1,13 +1,28 @@
-from jetson_inference import imageNet, detectNet, segNet, poseNet, actionNet, backgroundNet
+from jetson_inference import detectNet
 from jetson_utils import cudaFont, cudaAllocMapped, Log
 from enum import Enum
 
+import os
+import abc
+import glob
+import time
+import hashlib
+import logging
+import importlib.util
+import threading
+
+import numpy as np
+
+from profiles import ClassProfile
+
+
+logger = logging.getLogger(__name__)
 
 class Model:
     """
     Represents DNN models for classification, detection, pose, ect.
     """
-    def __init__(self,type, model, labels='', colors='', input_layer='', output_layer='', **kwargs):
+    def __init__(self,type, model, labels='', colors='', input_layer='', output_layer='', profile='', engine_cache='', tracking=True, min_frames=3, drop_frames=20, overlap=0.3, **kwargs):
         """
         Load the model, either from a built-in pre-trained model or from a user-provided model.
         
@@ -18,11 +33,20 @@ class Model:
             labels (string) -- path to the model's labels.txt file (optional)
             input_layer (string or dict) -- the model's input layer(s)
             output_layer (string or dict) -- the model's output layers()
+            profile (string) -- JSON (or path to a JSON file) of the model's class profile (optional for built-in models)
+            engine_cache (string) -- directory to keep the TensorRT engine built from a model file in (optional)
+            tracking (bool) -- enable detectNet's built-in tracker (disable it when tracking with a Tracker instead)
+            min_frames, drop_frames, overlap -- parameters of the built-in tracker (see IOUTracker)
         """
         self.model = model
         self.enabled = True
         self.results = None
         self.frames = 0
+        self.timings = {}
+        self.warmed_up = False
+        self.warmup_lock = threading.Lock()
+
+        model, self.engine_cached = self.CacheEngine(model, engine_cache)
         
         if not output_layer:
             output_layer = {'scores': '', 'bbox': ''}
@@ -35,23 +59,100 @@ class Model:
         print(input_layer)
         print(output_layer)
         
+        start = time.perf_counter()
+
         self.net = detectNet(model=model, labels=labels, colors=colors,
                              input_blob=input_layer,
                              output_cvg=output_layer['scores'],
                              output_bbox=output_layer['bbox'])
 
-        self.net.SetTrackingEnabled(True)
-        self.net.SetTrackingParams(minFrames=3, dropFrames=20, overlapThreshold=0.3)
+        self.timings['load'] = time.perf_counter() - start
+        logger.info("loaded %s in %.1f s (engine %s)", self.model, self.timings['load'],
+                    {True: 'cached', False: 'built', None: 'cache unknown'}[self.engine_cached])
+
+        self.net.SetTrackingEnabled(tracking)
+        self.net.SetTrackingParams(minFrames=min_frames, dropFrames=drop_frames, overlapThreshold=overlap)
         self.net.SetConfidenceThreshold(0.4)
+
+        self.labels = [self.net.GetClassDesc(i) for i in range(self.net.GetNumClasses())]
+        self.profile = ClassProfile.load(model, profile, self.labels)
             
-    def Process(self, img):
+    @staticmethod
+    def CacheEngine(model, cache_dir=''):
+        """
+        TensorRT engines are saved next to the model file they're built from, named after it.
+        With a cache directory, the model is loaded through a link in there (per model path),
+        so the engine goes to the cache even when the model's directory is read-only.
+        Engines older than their model are removed, so they get rebuilt.
+
+        Returns the path to load the model from, and whether an engine is cached for it
+        (None for built-in models, whose files are looked up by jetson-inference).
+        """
+        if not os.path.isfile(model):
+            return model, None
+
+        path = os.path.abspath(model)
+
+        if cache_dir:
+            directory = os.path.join(cache_dir, hashlib.sha1(path.encode()).hexdigest()[:12])
+            os.makedirs(directory, exist_ok=True)
+
+            if not os.access(directory, os.W_OK):
+                raise ValueError(f"the engine cache {cache_dir} isn't writable")
+
+            link = os.path.join(directory, os.path.basename(path))
+
+            if os.path.realpath(link) != os.path.realpath(path):
+                if os.path.lexists(link):
+                    os.remove(link)
+                os.symlink(path, link)
+
+            model = link
+        elif not os.access(os.path.dirname(path), os.W_OK):
+            logger.warning("%s isn't writable, so the TensorRT engine of %s can't be saved and will be rebuilt on every start (see --engine-cache)",
+                           os.path.dirname(path), os.path.basename(path))
+
+        engines = glob.glob(glob.escape(model) + '*.engine')
+
+        for engine in list(engines):
+            if os.path.getmtime(engine) < os.path.getmtime(path):
+                logger.warning("removing the TensorRT engine %s, which is older than its model", engine)
+                os.remove(engine)
+                engines.remove(engine)
+
+        return model, bool(engines)
+
+    def Warmup(self, width, height, frames=3):
+        """
+        Run the network on blank frames, so that CUDA and TensorRT's lazy initialization
+        isn't paid by the first real frames.  Models shared between streams are warmed up once.
+        """
+        with self.warmup_lock:
+            if self.warmed_up or frames <= 0:
+                return
+
+            start = time.perf_counter()
+            img = cudaAllocMapped(width=width, height=height, format='rgb8')
+
+            for _ in range(frames):
+                self.net.Detect(img, overlay='none')
+
+            self.timings['warmup'] = time.perf_counter() - start
+            self.warmed_up = True
+
+    def Process(self, img, roi=None):
         """
         Process an image with the model and return the results.
+        If regions of interest are given, only those parts of the image are processed.
         """
         if not self.enabled:
             return
             
-        self.results = self.net.Detect(img, overlay='none')
+        if roi:
+            crop, offset = roi.crop(img)
+            self.results = roi.restore(self.net.Detect(crop, overlay='none'), offset)
+        else:
+            self.results = self.net.Detect(img, overlay='none')
         
         self.frames += 1
         return self.results
@@ -67,7 +168,7 @@ class Model:
             
         if results is None:
             results = self.results
-            results = [result for result in results if result.ClassID == 1]
+            results = self.profile.filter(results)[0]
 
         self.net.Overlay(img, results)
             
@@ -85,9 +186,256 @@ class Model:
         """
         self.enabled = enabled
         
+    @staticmethod
+    def CreateTracker(name, **kwargs):
+        """
+        Create a tracker from TRACKERS by name (with its parameters), or return None for 'builtin' (detectNet's own).
+        """
+        if name == 'builtin':
+            return None
+
+        if name not in TRACKERS:
+            raise ValueError(f"invalid tracker '{name}' (should be builtin or one of {', '.join(TRACKERS)})")
+
+        return TRACKERS[name](**kwargs)
+
     @staticmethod
     def Usage():
         """
         Return help text for when the app is started with -h or --help
+        (only detection is supported)
+        """
+        return detectNet.Usage()
+
+class Tracker(abc.ABC):
+    """
+    Gives the detections of each frame the IDs of the tracks they belong to (in their TrackID),
+    for detectors without usable built-in tracking.  Keeps the state of one video stream.
+    Like detectNet's built-in tracker, the tracks missed in a frame but not dropped yet keep
+    being reported (as their last detection), so people aren't seen leaving on every miss.
+    """
+    def __init__(self):
+        self.detections = {}  # track ID => its last detection
+
+    def Update(self, detections):
+        """
+        Set the TrackID of a frame's detections (-1 for the ones not tracked yet), and return them
+        along with the last detections of the tracks lost in this frame that are still kept.
+        """
+        boxes = np.array([(detection.Left, detection.Top, detection.Right, detection.Bottom) for detection in detections], dtype=np.float64)
+
+        for detection, track_id in zip(detections, self.UpdateBoxes(boxes.reshape(-1, 4)).tolist()):
+            detection.TrackID = track_id
+
+        lost = {track_id: self.detections[track_id] for track_id in self.Lost().tolist() if track_id in self.detections}
+        self.detections = {**lost, **{detection.TrackID: detection for detection in detections if detection.TrackID >= 0}}
+
+        return list(detections) + list(lost.values())
+
+    @abc.abstractmethod
+    def UpdateBoxes(self, boxes):
+        """
+        Track a frame's boxes (N x 4 array of [left, top, right, bottom]) and return their track IDs.
+        """
+
+    def Lost(self):
+        """
+        Return the IDs of the tracks missed by the last UpdateBoxes() that are still kept.
+        """
+        return np.empty(0, dtype=np.int64)
+
+
+class IOUTracker(Tracker):
+    """
+    Tracker that associates each frame's boxes with the tracks they overlap the most (IoU),
+    like detectNet's built-in tracker, with every step vectorized over all the tracks and boxes.
+    The boxes the tracks are matched against are their last ones, or with `kalman`, the ones
+    predicted by a constant-velocity Kalman filter (which holds on to people moving fast or missed).
+    """
+    def __init__(self, min_frames=3, drop_frames=20, overlap=0.3, matching='greedy', kalman=False):
+        """
+        Parameters:
+
+            min_frames (int) -- frames a track must be detected in before it gets an ID
+            drop_frames (int) -- frames a track can go undetected before it's dropped
+            overlap (float) -- minimum IoU of a box with a track to continue it
+            matching (string) -- 'greedy' (highest IoU first) or 'hungarian' (optimal, needs scipy)
+            kalman (bool) -- match against the boxes predicted by a Kalman filter
+        """
+        if matching == 'hungarian':
+            if importlib.util.find_spec('scipy') is None:
+                raise ValueError("hungarian matching needs scipy (pip3 install scipy)")
+
+            from scipy.optimize import linear_sum_assignment
+            self.assign = linear_sum_assignment
+        elif matching != 'greedy':
+            raise ValueError(f"invalid matching '{matching}' (should be greedy or hungarian)")
+
+        super().__init__()
+
+        self.min_frames = min_frames
+        self.drop_frames = drop_frames
+        self.overlap = overlap
+        self.matching = matching
+        self.kalman = kalman
+        self.next_id = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hits = np.empty(0, dtype=np.int32)      # frames each track was detected in
+        self.misses = np.empty(0, dtype=np.int32)    # frames since each track was last detected
+        self.state = np.empty((0, 8))                # [cx, cy, w, h] of each track, and their velocities
+        self.covariance = np.empty((0, 8, 8))        # of the state (with kalman)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def UpdateBoxes(self, boxes):
+        predicted = self.Predict()
+        rows, cols = self.Match(self.IoU(predicted, boxes))
+        measured = np.concatenate([(boxes[:, :2] + boxes[:, 2:]) / 2, boxes[:, 2:] - boxes[:, :2]], axis=1)
+
+        # continue the matched tracks
+        self.hits[rows] += 1
+        self.misses += 1
+        self.misses[rows] = 0
+        self.Correct(rows, measured[cols])
+
+        track_ids = np.full(len(boxes), -1, dtype=np.int64)
+        track_ids[cols] = np.where(self.hits[rows] >= self.min_frames, self.ids[rows], -1)
+
+        # drop the tracks lost for too long, and the ones lost before getting an ID
+        keep = (self.misses <= self.drop_frames) & ((self.hits >= self.min_frames) | (self.misses == 0))
+        self.Select(keep)
+
+        # start tracks from the unmatched boxes
+        new = np.setdiff1d(np.arange(len(boxes)), cols)
+        ids = self.next_id + np.arange(len(new))
+        self.next_id += len(new)
+
+        if self.min_frames <= 1:
+            track_ids[new] = ids
+
+        self.ids = np.concatenate([self.ids, ids])
+        self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=np.int32)])
+        self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int32)])
+        self.state = np.concatenate([self.state, np.concatenate([measured[new], np.zeros((len(new), 4))], axis=1)])
+
+        if self.kalman:
+            height = measured[new, 3:4]
+            self.covariance = np.concatenate([self.covariance, self.Diagonal(np.concatenate([np.repeat(2 * self.POSITION_NOISE * height, 4, axis=1),
+                                                                                            np.repeat(10 * self.VELOCITY_NOISE * height, 4, axis=1)], axis=1) ** 2)])
+
+        return track_ids
+
+    def Lost(self):
+        # the tracks missed before getting an ID were dropped, so these all have one
+        return self.ids[self.misses > 0]
+
+    # noise of the Kalman filter, relative to the height of the boxes (as in DeepSORT)
+    POSITION_NOISE = 1 / 20
+    VELOCITY_NOISE = 1 / 160
+
+    # constant-velocity transition:  the position moves by the velocity every frame
+    TRANSITION = np.eye(8) + np.eye(8, k=4)
+
+    def Predict(self):
+        """
+        Advance the tracks by a frame and return their expected boxes (N x 4, [left, top, right, bottom]).
+        """
+        if self.kalman and len(self.ids):
+            height = self.state[:, 3:4]
+            noise = np.concatenate([np.repeat(self.POSITION_NOISE * height, 4, axis=1), np.repeat(self.VELOCITY_NOISE * height, 4, axis=1)], axis=1)
+
+            self.state = self.state @ self.TRANSITION.T
+            self.covariance = self.TRANSITION @ self.covariance @ self.TRANSITION.T + self.Diagonal(noise ** 2)
+
+        center, size = self.state[:, :2], np.maximum(self.state[:, 2:4], 0)
+        return np.concatenate([center - size / 2, center + size / 2], axis=1)
+
+    def Correct(self, rows, measured):
         """
-        return imageNet.Usage() + detectNet.Usage() + segNet.Usage() + actionNet.Usage() + poseNet.Usage() + backgroundNet.Usage() 
\ No newline at end of file
+        Move the tracks at `rows` to their new measurements (N x 4, [cx, cy, w, h]).
+        """
+        if not self.kalman:
+            self.state[rows, :4] = measured
+            return
+
+        covariance = self.covariance[rows]
+        innovation = covariance[:, :4, :4] + self.Diagonal((self.POSITION_NOISE * self.state[rows, 3:4].repeat(4, axis=1)) ** 2)
+        gain = np.linalg.solve(innovation, covariance[:, :4, :]).transpose(0, 2, 1)
+
+        self.state[rows] += (gain @ (measured - self.state[rows, :4])[:, :, None])[:, :, 0]
+        self.covariance[rows] = covariance - gain @ covariance[:, :4, :]
+
+    def Select(self, keep):
+        self.ids = self.ids[keep]
+        self.hits = self.hits[keep]
+        self.misses = self.misses[keep]
+        self.state = self.state[keep]
+
+        if self.kalman:
+            self.covariance = self.covariance[keep]
+
+    def Match(self, iou):
+        """
+        Pair the tracks (rows) with the boxes (columns) of an IoU matrix, keeping the pairs
+        that overlap at least `overlap`.  Returns the arrays of row and column indices.
+        Greedy matching takes the mutually best pairs in rounds, which picks the same pairs
+        as taking the highest IoU first, but a round at a time instead of a pair at a time.
+        """
+        if not iou.size:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        if self.matching == 'hungarian':
+            rows, cols = self.assign(iou, maximize=True)
+            matched = iou[rows, cols] >= self.overlap
+            return rows[matched], cols[matched]
+
+        iou = np.where(iou >= self.overlap, iou, 0)
+        all_rows, all_cols = [], []
+
+        while True:
+            best_cols = iou.argmax(axis=1)
+            best_rows = iou.argmax(axis=0)
+            rows = np.flatnonzero((best_rows[best_cols] == np.arange(len(iou))) & (iou[np.arange(len(iou)), best_cols] > 0))
+
+            if not len(rows):
+                break
+
+            cols = best_cols[rows]
+            all_rows.append(rows)
+            all_cols.append(cols)
+            iou[rows, :] = 0
+            iou[:, cols] = 0
+
+        if not all_rows:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        return np.concatenate(all_rows), np.concatenate(all_cols)
+
+    @staticmethod
+    def IoU(a, b):
+        """
+        Return the intersection over union of each box of `a` (N x 4) with each box of `b` (M x 4), as an N x M array.
+        """
+        top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+        bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+        area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+        area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+        return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+    @staticmethod
+    def Diagonal(values):
+        """
+        Turn rows of values (N x K) into diagonal matrices (N x K x K).
+        """
+        matrices = np.zeros(values.shape + values.shape[-1:])
+        index = np.arange(values.shape[-1])
+        matrices[:, index, index] = values
+        return matrices
+
+
+# the trackers that can replace detectNet's built-in one (--tracker)
+TRACKERS = {
+    'iou': IOUTracker,
+}
@@ -0,0 +1,71 @@
+import numpy as np
+
+from jetson_utils import cudaAllocMapped, cudaResize, cudaConvertColor, cudaToNumpy, cudaDeviceSynchronize
+
+
+class MotionGate:
+    """
+    Cheap frame-difference check that decides whether a frame needs inference.
+    Each frame is downscaled and converted to grayscale on the GPU, then compared
+    against the frame that was last sent to inference.  If few enough pixels
+    changed, the previous detections can be reused instead of running the detector.
+    """
+    def __init__(self, threshold=0.01, pixel_threshold=20, force_interval=30, width=80, height=45):
+        """
+        Parameters:
+
+            threshold (float) -- fraction of pixels that must change for the frame to count as motion
+            pixel_threshold (int) -- how much (0-255) a pixel's luma must change to count as changed
+            force_interval (int) -- run inference at least every N frames regardless of motion
+            width, height (int) -- size of the downscaled comparison image
+        """
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.force_interval = force_interval
+        self.width = width
+        self.height = height
+
+        self.small = None
+        self.gray = None
+        self.reference = None
+        self.since_inference = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def changed(self, img):
+        """
+        Return True if `img` should be sent to inference, False if the previous detections still apply.
+        """
+        self.frames += 1
+
+        if self.small is None:
+            self.small = cudaAllocMapped(width=self.width, height=self.height, format=img.format)
+            self.gray = cudaAllocMapped(width=self.width, height=self.height, format='gray8')
+
+        cudaResize(img, self.small)
+        cudaConvertColor(self.small, self.gray)
+        cudaDeviceSynchronize()
+
+        luma = cudaToNumpy(self.gray).reshape(self.height, self.width).astype(np.int16)
+
+        if self.reference is not None and self.since_inference + 1 < self.force_interval:
+            changed = np.count_nonzero(np.abs(luma - self.reference) > self.pixel_threshold) / luma.size
+
+            if changed < self.threshold:
+                self.since_inference += 1
+                self.skipped += 1
+                return False
+
+        self.reference = luma
+        self.since_inference = 0
+        return True
+
+    def stats(self):
+        """
+        Return the number of frames checked and skipped, and the skip ratio.
+        """
+        return {
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'skip_ratio': self.skipped / self.frames if self.frames else 0.0,
+        }
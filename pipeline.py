@@ -0,0 +1,164 @@
+import time
+import random
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+
+from metrics import RateLimitedLogger
+
+
+logger = logging.getLogger(__name__)
+
+
+class Backoff:
+    """
+    Exponential backoff:  each delay doubles (up to `maximum`), with some random jitter
+    so that sources failing together don't retry in lockstep, until reset() on success.
+    """
+    def __init__(self, initial=1.0, maximum=60.0, factor=2.0, jitter=0.1):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.failures = 0
+
+    def next(self):
+        """
+        Count a failure and return the seconds to wait before the next attempt.
+        """
+        delay = min(self.initial * self.factor ** self.failures, self.maximum)
+
+        if delay < self.maximum:
+            self.failures += 1
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def reset(self):
+        self.failures = 0
+
+
+class DropOldestQueue:
+    """
+    Bounded queue between two pipeline stages.  When it is full, putting a new
+    item discards the oldest one, so the consumer always works on the freshest data.
+    """
+    def __init__(self, maxsize=1):
+        self.items = deque(maxlen=max(1, maxsize))
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Take the oldest item, waiting for one for at most `timeout` seconds (returns None if there's none).
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items, timeout):
+                return None
+
+            return self.items.popleft()
+
+
+class StageStats:
+    """
+    Latency counters of one processing stage (capture, inference, ect),
+    including a histogram over fixed buckets (upper bounds in seconds).
+    """
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self.processed = 0
+        self.last = 0.0
+        self.average = 0.0
+        self.max = 0.0
+        self.sum = 0.0
+        self.buckets = [0] * (len(self.BUCKETS) + 1)  # the last one is +Inf
+
+    def record(self, seconds):
+        self.last = seconds
+        self.max = max(self.max, seconds)
+        self.average = seconds if not self.processed else self.average + self.smoothing * (seconds - self.average)
+        self.sum += seconds
+        self.buckets[bisect_left(self.BUCKETS, seconds)] += 1
+        self.processed += 1
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'latency_ms': self.last * 1000,
+            'latency_avg_ms': self.average * 1000,
+            'latency_max_ms': self.max * 1000,
+        }
+
+
+class Stage(threading.Thread):
+    """
+    Thread running one step of the pipeline:  it takes items from its input queue,
+    applies `function`, and puts the (non-None) results on its output queue.
+    A stage without an input queue is a source, and calls `function()` repeatedly.
+    It runs until the `stop` event is set.
+    """
+    def __init__(self, name, function, input=None, output=None, stats=None, log_interval=10.0, stop=None):
+        super().__init__(name=name, daemon=True)
+
+        self.function = function
+        self.input = input
+        self.output = output
+        self.stop = stop if stop is not None else threading.Event()
+        self.stats = stats if stats is not None else StageStats()
+        self.errors = 0
+        self.logger = RateLimitedLogger(logger, interval=log_interval)
+
+    def run(self):
+        """
+        Run the stage's main loop.
+        """
+        # back off when the stage keeps failing, so that it doesn't spin the CPU
+        backoff = Backoff(0.01, 1.0)
+
+        while not self.stop.is_set():
+            if self.input is not None:
+                item = self.input.get(timeout=0.5)  # so the stop event gets checked
+
+                if item is None:
+                    continue
+
+            start = time.perf_counter()
+
+            try:
+                item = self.function(item) if self.input is not None else self.function()
+            except Exception:
+                self.errors += 1
+                self.logger.error(self.name, "pipeline stage %s failed", self.name, exc_info=True)
+                self.stop.wait(backoff.next())
+                continue
+
+            backoff.reset()
+
+            self.stats.record(time.perf_counter() - start)
+
+            if item is not None and self.output is not None:
+                self.output.put(item)
+
+    def as_dict(self):
+        """
+        Return the stage's latency counters along with the depth and drops of its input queue.
+        """
+        stats = self.stats.as_dict()
+
+        if self.input is not None:
+            stats['queue_depth'] = len(self.input)
+            stats['queue_dropped'] = self.input.dropped
+
+        return stats
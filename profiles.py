@@ -0,0 +1,124 @@
+import os
+import json
+
+
+# class profiles of the built-in detection models (by model name)
+BUILTIN_PROFILES = {
+    'peoplenet': {'people': ['person'], 'count': 'max', 'count_classes': ['person', 'face']},
+    'peoplenet-pruned': {'people': ['person'], 'count': 'max', 'count_classes': ['person', 'face']},
+    'ssd-mobilenet-v1': {'people': ['person']},
+    'ssd-mobilenet-v2': {'people': ['person']},
+    'ssd-inception-v2': {'people': ['person']},
+    'dashcamnet': {'people': ['person']},
+    'trafficcamnet': {'people': ['person']},
+}
+
+# label names picked up as people when a model has no profile
+PEOPLE_LABELS = ('person', 'people', 'pedestrian')
+
+
+class ClassProfile:
+    """
+    Which of a detector's classes are people, and how to count them per frame:
+
+        'people' -- the number of people detections
+        'max'    -- the largest number of detections of any one of the count classes
+                    (e.g. people and faces, when either can be missed)
+        'sum'    -- the number of detections of any of the count classes
+
+    The class IDs are resolved once (from label names if needed) into lookup tables,
+    so filtering a frame's detections is a single pass.
+    """
+    RULES = ('people', 'max', 'sum')
+
+    def __init__(self, people, count='people', count_classes=None, labels=None):
+        """
+        Parameters:
+
+            people (list) -- class IDs or labels of the people classes (tracked and overlaid)
+            count (string) -- the counting rule ('people', 'max' or 'sum')
+            count_classes (list) -- class IDs or labels counted by the 'max' and 'sum' rules (defaults to `people`)
+            labels (list) -- the model's class labels, indexed by class ID
+        """
+        if count not in self.RULES:
+            raise ValueError(f"invalid counting rule '{count}' (should be one of {', '.join(self.RULES)})")
+
+        self.labels = labels or []
+        self.people = frozenset(self.resolve(people))
+        self.count = count
+        self.count_index = {class_id: index for index, class_id in enumerate(self.resolve(count_classes or people))}
+
+        if not self.people:
+            raise ValueError("the class profile doesn't have any people classes")
+
+    def resolve(self, classes):
+        """
+        Map labels to class IDs (class IDs are passed through).
+        """
+        lowered = [label.lower() for label in self.labels]
+        class_ids = []
+
+        for entry in classes:
+            if isinstance(entry, int):
+                class_ids.append(entry)
+            elif entry.lower() in lowered:
+                class_ids.append(lowered.index(entry.lower()))
+            else:
+                raise ValueError(f"unknown class '{entry}' (the model's classes are: {', '.join(self.labels)})")
+
+        return class_ids
+
+    @staticmethod
+    def load(model, config='', labels=None):
+        """
+        Create the profile of a model, from (in order of preference) a JSON string or file,
+        the built-in profile of the model, or its labels named like people.
+
+        The JSON looks like {"people": ["person"], "count": "max", "count_classes": ["person", "face"]}
+        """
+        if config:
+            if os.path.isfile(config):
+                with open(config) as f:
+                    config = json.load(f)
+            else:
+                config = json.loads(config)
+        else:
+            config = BUILTIN_PROFILES.get(os.path.basename(model).lower())
+
+        if config is None:
+            people = [label for label in (labels or []) if label.lower() in PEOPLE_LABELS]
+
+            if not people:
+                raise ValueError(f"no class profile for model '{model}' and none of its labels look like people (use --class-profile)")
+
+            config = {'people': people}
+
+        return ClassProfile(config['people'], config.get('count', 'people'), config.get('count_classes'), labels)
+
+    def filter(self, results):
+        """
+        Pick out the detections of people in a single pass.
+        Returns them along with the people count of the frame.
+        """
+        people = self.people
+        count_index = self.count_index
+        counts = [0] * len(count_index)
+        people_results = []
+
+        for result in results:
+            class_id = result.ClassID
+
+            if class_id in people:
+                people_results.append(result)
+
+            index = count_index.get(class_id)
+
+            if index is not None:
+                counts[index] += 1
+
+        if self.count == 'max':
+            return people_results, max(counts)
+        elif self.count == 'sum':
+            return people_results, sum(counts)
+
+        return people_results, len(people_results)
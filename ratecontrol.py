@@ -0,0 +1,126 @@
+import math
+import time
+
+
+class RateController:
+    """
+    Decides which frames are sent to the detector, so a stream can trade detection
+    frequency for throughput.  Detection runs on every k-th frame; the other frames
+    reuse the previous detections (which keeps their tracks alive).
+
+    k is either set directly, or picked automatically from the measured inference
+    latency and frame period, to reach a target frame rate and/or to keep inference
+    under a fraction of the wall time (its GPU budget).
+    """
+    def __init__(self, target_fps=0.0, budget=0.0, max_interval=10, smoothing=0.1):
+        """
+        Parameters:
+
+            target_fps (float) -- frame rate to sustain by skipping detection (0 to disable)
+            budget (float) -- maximum fraction (0-1) of the time spent in detection (0 to disable)
+            max_interval (int) -- the largest k the controller may pick
+            smoothing (float) -- weight of new measurements in the moving averages
+        """
+        self.target_fps = target_fps
+        self.budget = budget
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+
+        self.interval = 1
+        self.counter = 0
+        self.latency = 0.0            # average seconds per detection
+        self.period = 0.0             # average seconds between frames
+        self.inference_period = 0.0   # average seconds between detections
+        self.last_frame = None
+        self.last_inference = None
+
+    def average(self, value, sample):
+        return sample if not value else value + self.smoothing * (sample - value)
+
+    def should_infer(self):
+        """
+        Called once per frame.  Returns True if this frame should be sent to the detector.
+        """
+        now = time.perf_counter()
+
+        if self.last_frame is not None:
+            self.period = self.average(self.period, now - self.last_frame)
+
+        self.last_frame = now
+        self.counter += 1
+
+        if self.counter < self.interval:
+            return False
+
+        self.counter = 0
+        return True
+
+    def record(self, seconds):
+        """
+        Record the latency of a detection, and re-pick the interval if it is automatic.
+        """
+        now = time.perf_counter()
+
+        if self.last_inference is not None:
+            self.inference_period = self.average(self.inference_period, now - self.last_inference)
+
+        self.last_inference = now
+        self.latency = self.average(self.latency, seconds)
+
+        if self.target_fps > 0 or self.budget > 0:
+            self.interval = self.pick_interval()
+
+    def pick_interval(self):
+        """
+        With detection on every k-th frame, a frame costs c + t/k on average, where t is the
+        detection latency and c is everything else.  Pick the smallest k such that the frame
+        period is within 1/target_fps, and detection takes at most `budget` of the time.
+        """
+        t = self.latency
+        c = max(self.period - t / self.interval, 1e-6)
+        k = 1.0
+
+        if self.target_fps > 0:
+            slack = 1.0 / self.target_fps - c
+            k = max(k, t / slack if slack > 0 else self.max_interval)
+
+        if self.budget > 0:
+            k = max(k, t * (1.0 - self.budget) / (self.budget * c))
+
+        return int(min(max(math.ceil(k), 1), self.max_interval))
+
+    def get_interval(self):
+        return self.interval
+
+    def set_interval(self, interval):
+        """
+        Set k by hand (this disables the automatic target FPS and budget).
+        """
+        self.interval = max(int(interval), 1)
+        self.target_fps = 0.0
+        self.budget = 0.0
+
+    def get_target_fps(self):
+        return self.target_fps
+
+    def set_target_fps(self, fps):
+        self.target_fps = max(float(fps), 0.0)
+
+    def get_budget(self):
+        return self.budget
+
+    def set_budget(self, budget):
+        self.budget = min(max(float(budget), 0.0), 1.0)
+
+    def stats(self):
+        """
+        Return the current interval, and the achieved frame and detection rates.
+        """
+        return {
+            'interval': self.interval,
+            'target_fps': self.target_fps,
+            'budget': self.budget,
+            'fps': 1.0 / self.period if self.period else 0.0,
+            'inference_fps': 1.0 / self.inference_period if self.inference_period else 0.0,
+            'latency_ms': self.latency * 1000,
+        }
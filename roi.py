@@ -0,0 +1,144 @@
+import json
+import os
+
+from jetson_utils import cudaAllocMapped, cudaCrop
+
+
+class RegionsOfInterest:
+    """
+    The parts of a camera's view that get sent to the detector.  Each region is either
+    a rectangle [left, top, right, bottom] or a polygon [[x, y], [x, y], ...] in pixels.
+    The frame is cropped to the bounding box of all the regions before detection, the
+    detections are mapped back to full-frame coordinates, and detections whose center
+    falls outside every region are dropped.
+    """
+    def __init__(self, regions=None):
+        self.buffer = None
+        self.set_regions(regions or [])
+
+    @staticmethod
+    def load(config):
+        """
+        Create the regions from a JSON string, or from the path of a JSON file.
+        """
+        if not config:
+            return RegionsOfInterest()
+
+        if os.path.isfile(config):
+            with open(config) as f:
+                return RegionsOfInterest(json.load(f))
+
+        return RegionsOfInterest(json.loads(config))
+
+    def get_regions(self):
+        return self.regions
+
+    def set_regions(self, regions):
+        """
+        Replace the regions (raises ValueError if they are malformed).
+        """
+        if not isinstance(regions, list):
+            raise ValueError("regions of interest should be a list of rectangles or polygons")
+
+        shapes = []
+
+        for region in regions:
+            if isinstance(region, list) and len(region) == 4 and all(isinstance(v, (int, float)) for v in region):
+                left, top, right, bottom = region
+
+                if right <= left or bottom <= top:
+                    raise ValueError(f"invalid rectangle {region} (should be [left, top, right, bottom])")
+
+                shapes.append(('rect', (left, top, right, bottom), None))
+            elif isinstance(region, list) and len(region) >= 3 and all(isinstance(p, list) and len(p) == 2 for p in region):
+                xs = [p[0] for p in region]
+                ys = [p[1] for p in region]
+                shapes.append(('polygon', (min(xs), min(ys), max(xs), max(ys)), [tuple(p) for p in region]))
+            else:
+                raise ValueError(f"invalid region {region} (should be [left, top, right, bottom] or [[x, y], ...])")
+
+        box = None
+
+        if shapes:
+            box = (min(shape[1][0] for shape in shapes), min(shape[1][1] for shape in shapes),
+                   max(shape[1][2] for shape in shapes), max(shape[1][3] for shape in shapes))
+
+        # swap the whole state at once, since the stream thread may be reading it
+        self.state = (shapes, box)
+        self.regions = regions
+
+    def __bool__(self):
+        return bool(self.state[0])
+
+    def crop(self, img):
+        """
+        Crop the image to the bounding box of the regions.
+        Returns the cropped image and the (x, y) offset of the crop in the frame.
+        """
+        shapes, box = self.state
+
+        if box is None:
+            return img, (0, 0)
+
+        left = max(int(box[0]), 0)
+        top = max(int(box[1]), 0)
+        right = min(int(box[2]), img.width)
+        bottom = min(int(box[3]), img.height)
+
+        if right <= left or bottom <= top or (left == 0 and top == 0 and right == img.width and bottom == img.height):
+            return img, (0, 0)
+
+        width, height = right - left, bottom - top
+
+        if self.buffer is None or self.buffer.width != width or self.buffer.height != height or self.buffer.format != img.format:
+            self.buffer = cudaAllocMapped(width=width, height=height, format=img.format)
+
+        cudaCrop(img, self.buffer, (left, top, right, bottom))
+        return self.buffer, (left, top)
+
+    def restore(self, results, offset):
+        """
+        Shift detections made on the crop back to frame coordinates, and drop the ones outside the regions.
+        """
+        shapes, box = self.state
+        x, y = offset
+        kept = []
+
+        for result in results:
+            if x or y:
+                result.Left += x
+                result.Right += x
+                result.Top += y
+                result.Bottom += y
+
+            if self.contains(shapes, (result.Left + result.Right) / 2, (result.Top + result.Bottom) / 2):
+                kept.append(result)
+
+        return kept
+
+    @staticmethod
+    def contains(shapes, x, y):
+        """
+        Return True if the point is inside any of the regions (or if there are none).
+        """
+        if not shapes:
+            return True
+
+        for kind, (left, top, right, bottom), points in shapes:
+            if not (left <= x <= right and top <= y <= bottom):
+                continue
+
+            if kind == 'rect':
+                return True
+
+            # ray casting: count the polygon edges crossed by a ray going right from the point
+            inside = False
+
+            for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+                if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+
+            if inside:
+                return True
+
+        return False
@@ -0,0 +1,223 @@
+import time
+import threading
+
+from pipeline import StageStats
+
+
+class InferenceScheduler:
+    """
+    Shares one set of loaded models between several streams.  Each stream calls
+    `submit()` from its own thread, and the scheduler lets them run inference one
+    at a time, picking the next waiting stream round-robin or by priority.
+
+    With the 'batch' policy, the latest frames of the streams are gathered instead:
+    once every stream is waiting (or the oldest request has waited `batch_wait`
+    seconds), one of the waiting threads runs the whole batch back-to-back while
+    holding the models, and hands each stream its results.
+    """
+    POLICIES = ('round-robin', 'priority', 'batch')
+
+    def __init__(self, policy='round-robin', batch_wait=0.005, max_batch=0):
+        """
+        Parameters:
+
+            policy (string) -- 'round-robin', 'priority' or 'batch'
+            batch_wait (float) -- seconds the oldest request waits for a batch to fill (with 'batch')
+            max_batch (int) -- the most requests run per batch (0 for one per stream)
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"invalid scheduling policy '{policy}' (should be one of {', '.join(self.POLICIES)})")
+
+        self.policy = policy
+        self.batch_wait = batch_wait
+        self.max_batch = max_batch
+        self.requests = {}     # stream ID => pending batch request
+        self.batches = {}      # batch size => number of batches run
+        self.queue_wait = StageStats()
+        self.order = []        # stream IDs in registration order
+        self.priorities = {}   # stream ID => priority (higher runs first)
+        self.waiting = {}      # stream ID => time it started waiting
+        self.served = {}       # stream ID => number of inferences run
+        self.wait_time = {}    # stream ID => total seconds spent waiting
+        self.last = None
+        self.busy = False
+        self.condition = threading.Condition()
+
+    def register(self, stream_id, priority=0):
+        """
+        Add a stream to the schedule.
+        """
+        with self.condition:
+            self.order.append(stream_id)
+            self.priorities[stream_id] = priority
+            self.served[stream_id] = 0
+            self.wait_time[stream_id] = 0.0
+
+    def submit(self, stream_id, function, *args):
+        """
+        Wait for `stream_id`'s turn, then run `function(*args)` and return its result.
+        """
+        if self.policy == 'batch':
+            return self.submit_batch(stream_id, function, *args)
+
+        with self.condition:
+            self.waiting[stream_id] = time.perf_counter()
+
+            while self.busy or self.next() != stream_id:
+                self.condition.wait()
+
+            self.record_wait(stream_id, time.perf_counter() - self.waiting.pop(stream_id))
+            self.served[stream_id] += 1
+            self.last = stream_id
+            self.busy = True
+
+        try:
+            return function(*args)
+        finally:
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def submit_batch(self, stream_id, function, *args):
+        """
+        Queue `function(*args)` for the next batch and return its result once the batch ran.
+        The thread that finds a batch ready (full, or past its deadline) runs it.
+        """
+        request = BatchRequest(function, args)
+
+        with self.condition:
+            self.waiting[stream_id] = request.queued
+            self.requests[stream_id] = request
+            self.condition.notify_all()
+
+            while not request.done:
+                if self.busy or not self.requests:
+                    self.condition.wait()
+                    continue
+
+                timeout = min(pending.queued for pending in self.requests.values()) + self.batch_wait - time.perf_counter()
+
+                if len(self.requests) < (self.max_batch or len(self.order)) and timeout > 0:
+                    self.condition.wait(timeout)
+                    continue
+
+                batch = self.take_batch()
+                self.condition.release()  # run the batch without holding up the other streams' submits
+
+                try:
+                    for pending in batch:
+                        pending.run()
+                finally:
+                    self.condition.acquire()
+
+                    for pending in batch:
+                        pending.done = True
+
+                    self.busy = False
+                    self.condition.notify_all()
+
+        return request.result()
+
+    def take_batch(self):
+        """
+        Take the pending requests (up to max_batch, round-robin after the last stream served)
+        as a batch, and mark the models busy.  Called with the condition held.
+        """
+        start = self.order.index(self.last) + 1 if self.last in self.order else 0
+        stream_ids = [stream_id for stream_id in self.order[start:] + self.order[:start] if stream_id in self.requests]
+
+        if self.max_batch:
+            stream_ids = stream_ids[:self.max_batch]
+
+        now = time.perf_counter()
+        batch = []
+
+        for stream_id in stream_ids:
+            request = self.requests.pop(stream_id)
+            del self.waiting[stream_id]
+            self.record_wait(stream_id, now - request.queued)
+            self.served[stream_id] += 1
+            batch.append(request)
+
+        self.batches[len(batch)] = self.batches.get(len(batch), 0) + 1
+        self.last = stream_ids[-1]
+        self.busy = True
+        return batch
+
+    def record_wait(self, stream_id, seconds):
+        self.wait_time[stream_id] += seconds
+        self.queue_wait.record(seconds)
+
+    def next(self):
+        """
+        Return the waiting stream that should run next.  Streams are visited in
+        round-robin order starting after the last one served; with the 'priority'
+        policy, the highest-priority waiting stream wins and round-robin breaks ties.
+        """
+        if not self.waiting:
+            return None
+
+        start = self.order.index(self.last) + 1 if self.last in self.order else 0
+        candidates = [stream_id for stream_id in self.order[start:] + self.order[:start] if stream_id in self.waiting]
+
+        if self.policy == 'priority':
+            return max(candidates, key=lambda stream_id: self.priorities[stream_id])
+
+        return candidates[0]
+
+    def stats(self):
+        """
+        Return the number of inferences and the average wait per stream.
+        """
+        return {
+            stream_id: {
+                'priority': self.priorities[stream_id],
+                'served': self.served[stream_id],
+                'wait_avg_ms': self.wait_time[stream_id] / max(self.served[stream_id], 1) * 1000,
+            }
+            for stream_id in self.order
+        }
+
+    def batch_stats(self):
+        """
+        Return the number of batches run per batch size, the average batch size, and the queue wait.
+        """
+        with self.condition:
+            batches = dict(self.batches)
+
+        total = sum(batches.values())
+
+        return {
+            'batches': total,
+            'batch_size_avg': sum(size * count for size, count in batches.items()) / max(total, 1),
+            'batch_sizes': batches,
+            'queue_wait_avg_ms': self.queue_wait.sum / max(self.queue_wait.processed, 1) * 1000,
+            'queue_wait_max_ms': self.queue_wait.max * 1000,
+        }
+
+
+class BatchRequest:
+    """
+    One stream's inference call waiting in (or running as part of) a batch.
+    """
+    __slots__ = ('function', 'args', 'queued', 'done', 'value', 'error')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.queued = time.perf_counter()
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.value = self.function(*self.args)
+        except Exception as error:
+            self.error = error
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+
+        return self.value
@@ -0,0 +1,180 @@
+import io
+import time
+import zlib
+import atexit
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+from writer import BatchWriter
+
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryStore(BatchWriter):
+    """
+    Persistent count history in an SQLite database, shared by the streams.
+
+    The streams queue their closed per-second buckets (max, min, sum and number of
+    frames), and this thread inserts them in batches, updating the per-minute, hourly
+    and daily (UTC) rollup tables they fall in as it goes.  Range queries then read
+    the coarsest table that fits, so reports over months touch a few thousand rows.
+    The per-second rows are pruned after `retention` seconds; the rollups are kept.
+    """
+    RESOLUTIONS = (1, 60, 3600, 86400)
+    ERRORS = (sqlite3.Error,)
+
+    def __init__(self, path, flush_interval=1.0, batch_size=1000, queue_size=100000, retention=2592000):
+        """
+        Open (or create) the database and start the writer thread.
+
+        Parameters:
+
+            path (string) -- path to the SQLite database
+            flush_interval (float) -- seconds to wait for a batch to fill before writing it anyway
+            batch_size (int) -- number of buckets inserted per transaction at most
+            queue_size (int) -- number of buckets that can be pending before new ones are dropped
+            retention (int) -- seconds to keep the per-second buckets for (0 to keep them forever)
+        """
+        super().__init__(path, logger, flush_interval=flush_interval, batch_size=batch_size, queue_size=queue_size)
+
+        self.retention = retention
+        self.local = threading.local()
+        self.db = None        # the writer thread's connection
+        self.pruned_at = 0.0
+
+        db = self.connect()
+        db.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer (and vice versa)
+
+        with db:
+            for resolution in self.RESOLUTIONS:
+                db.execute(f"CREATE TABLE IF NOT EXISTS counts_{resolution} ("
+                           "stream TEXT NOT NULL, time INTEGER NOT NULL, max INTEGER, min INTEGER, sum INTEGER, samples INTEGER, "
+                           "PRIMARY KEY (stream, time)) WITHOUT ROWID")
+
+        db.close()
+
+        self.start()
+
+        atexit.register(self.close)
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def reader(self):
+        """
+        Return the calling thread's connection for queries.
+        """
+        db = getattr(self.local, 'db', None)
+
+        if db is None:
+            db = self.local.db = self.connect()
+
+        return db
+
+    def add(self, stream, rows):
+        """
+        Queue closed per-second buckets (time, max, min, sum, samples) of a stream.
+        Never blocks; returns False if some were dropped.
+        """
+        return all(self.put((stream,) + tuple(row)) for row in rows)
+
+    def run(self):
+        self.db = self.connect()
+        super().run()
+
+    def write_batch(self, rows):
+        """
+        Insert a batch of per-second buckets and recompute the rollup buckets it touches, in one
+        transaction.  Each rollup is rebuilt from the next finer table (minutes from seconds,
+        hours from minutes, days from hours) rather than added to, so buckets sent again
+        (like the open one restored from a checkpoint after a restart) aren't counted twice.
+        """
+        with self.db as db:
+            db.executemany("INSERT OR REPLACE INTO counts_1 VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+            for source, resolution in zip(self.RESOLUTIONS, self.RESOLUTIONS[1:]):
+                buckets = sorted({(stream, timestamp - timestamp % resolution) for stream, timestamp, *_ in rows})
+                db.executemany(f"INSERT OR REPLACE INTO counts_{resolution} SELECT stream, ?, max(max), min(min), sum(sum), sum(samples) "
+                               f"FROM counts_{source} WHERE stream = ? AND time >= ? AND time < ? GROUP BY stream",
+                               [(start, stream, start, start + resolution) for stream, start in buckets])
+
+            if self.retention and time.monotonic() - self.pruned_at > 3600:
+                cutoff = max(row[1] for row in rows) - self.retention
+                db.execute("DELETE FROM counts_1 WHERE time < ?", (cutoff - cutoff % 60,))  # keep the minute being rolled up
+                self.pruned_at = time.monotonic()
+
+    def query(self, stream, start=None, end=None, resolution=None, limit=None):
+        """
+        Return the buckets of a stream overlapping `start` up to (not including) `end` (epoch seconds)
+        as (start times, max, min, avg) arrays, along with their resolution.  Without one,
+        the finest resolution that returns at most 5000 buckets is picked.
+        """
+        end = int(end if end is not None else time.time() + 1)
+        start = int(start if start is not None else 0)
+
+        if resolution is None:
+            resolution = next((resolution for resolution in self.RESOLUTIONS if (end - start) / resolution <= 5000), self.RESOLUTIONS[-1])
+        elif resolution not in self.RESOLUTIONS:
+            raise ValueError(f"invalid resolution {resolution} (should be one of {', '.join(map(str, self.RESOLUTIONS))})")
+
+        sql = f"SELECT time, max, min, sum, samples FROM counts_{resolution} WHERE stream = ? AND time >= ? AND time < ? ORDER BY time"
+        parameters = [stream, start - start % resolution, end]  # include the bucket `start` falls in
+
+        if limit is not None:
+            sql = f"SELECT * FROM ({sql} DESC LIMIT ?) ORDER BY time"
+            parameters.append(limit)
+
+        columns = np.array(self.reader().execute(sql, parameters).fetchall(), dtype=np.float64).reshape(-1, 5)
+        return columns[:, 0], columns[:, 1].astype(int), columns[:, 2].astype(int), columns[:, 3] / np.maximum(columns[:, 4], 1), resolution
+
+    def export(self, stream, start=None, end=None, resolution=1, format='csv', chunk_size=10000):
+        """
+        Return a generator of a compressed export of a range of buckets, chunk by chunk:
+        'csv' is gzip-compressed CSV, 'npz' a compressed numpy archive of the columns.
+        """
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f"invalid resolution {resolution} (should be one of {', '.join(map(str, self.RESOLUTIONS))})")
+
+        if format not in ('csv', 'npz'):
+            raise ValueError(f"invalid export format '{format}' (should be 'csv' or 'npz')")
+
+        end = int(end if end is not None else time.time() + 1)
+        start = int(start if start is not None else 0)
+
+        def generate():
+            db = self.connect()
+            cursor = db.execute(f"SELECT time, max, min, sum, samples FROM counts_{resolution} "
+                                "WHERE stream = ? AND time >= ? AND time < ? ORDER BY time", (stream, start - start % resolution, end))
+
+            if format == 'npz':
+                columns = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 5)
+                buffer = io.BytesIO()
+                np.savez_compressed(buffer, time=columns[:, 0], max=columns[:, 1], min=columns[:, 2],
+                                    avg=columns[:, 3] / np.maximum(columns[:, 4], 1), samples=columns[:, 4])
+                yield buffer.getvalue()
+                db.close()
+                return
+
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip container
+            yield compressor.compress(b"timestamp,max,min,avg\n")
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+
+                if not rows:
+                    break
+
+                lines = ''.join(f"{timestamp},{max_count},{min_count},{total / max(samples, 1):.2f}\n"
+                                for timestamp, max_count, min_count, total, samples in rows)
+                yield compressor.compress(lines.encode())
+
+            yield compressor.flush()
+            db.close()
+
+        return generate()
@@ -20,13 +20,33 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 #
+import os
 import sys
+import time
+import logging
 import threading
-import traceback
 from datetime import datetime
-from dataclasses import dataclass
+
+import numpy as np
+from dataclasses import dataclass, field
 
 from model import Model
+from history import CountHistory
+from dwell import DwellHistory
+from tracks import TrackTable
+from viewers import ViewerTracker
+from metrics import RateLimitedLogger
+from csvlog import CSVLogger
+from pipeline import Backoff, DropOldestQueue, Stage, StageStats
+from motion import MotionGate
+from ratecontrol import RateController
+from roi import RegionsOfInterest
+from lines import CountingLines
+from heatmap import OccupancyHeatmap
+from events import EventBroadcaster
+from bus import AnalyticsBus
+from checkpoint import Checkpointer, load as checkpoint_load
+from capture import SupervisedSource
 from jetson_utils import videoSource, videoOutput
 
 @dataclass
@@ -35,36 +55,119 @@ class Person:
     time_in: int
 
 
+@dataclass
+class Frame:
+    """
+    One captured image and what the stages computed for it, passed down the pipeline.
+    """
+    img: object
+    timestamp: datetime
+    results: dict = field(default_factory=dict)   # model key => detections
+    people: dict = field(default_factory=dict)    # model key => detections of people
+
+
+logger = logging.getLogger(__name__)
+
+
 class Stream(threading.Thread):
     """
     Thread for streaming video and applying DNN inference
     """
-    def __init__(self, args):
+    def __init__(self, args, id='0', input=None, output=None, log=None, models=None, scheduler=None, store=None, checkpoint=None):
         """
         Create a stream from input/output video sources, along with DNN models.
+
+        Parameters:
+
+            args -- the parsed command-line arguments
+            id (string) -- the stream's ID (used in the /streams/<id>/... routes)
+            input (string) -- the input video URI (defaults to --input)
+            output (string) -- the output video URI (defaults to --output)
+            log (string) -- path to the stream's CSV log (defaults to --log)
+            models (dict) -- already-loaded models to share with other streams (defaults to loading them)
+            scheduler (InferenceScheduler) -- schedules inference on shared models between streams
+            store (HistoryStore) -- persistent store the per-second counts are saved to
+            checkpoint (string) -- path to the stream's checkpoint (defaults to --checkpoint)
         """
         super().__init__()
         
         self.args = args
-        self.input = videoSource(args.input, argv=sys.argv)
-        self.output = videoOutput(args.output, argv=sys.argv)
+        self.id = id
+        self.input_url = input if input is not None else args.input
+        self.output_url = output if output is not None else args.output
+        self.log_path = log if log is not None else args.log
+        self.checkpoint_path = checkpoint if checkpoint is not None else args.checkpoint
+        self.startup = {}  # step => seconds it took
+        self.started = time.perf_counter()
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+
+        start = time.perf_counter()
+        self.input = SupervisedSource(self.input_url, argv=sys.argv, timeout=args.capture_timeout, stall_timeout=args.stall_timeout,
+                                      backoff=Backoff(args.reconnect_min, args.reconnect_max), log_interval=args.log_interval)
+        self.startup['input'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.output = videoOutput(self.output_url, argv=sys.argv)
+        self.startup['output'] = time.perf_counter() - start
+
+        self.scheduler = scheduler
         self.frames = 0
-        self.models = {}
-        self.time_ins = {}
-        self.duration_history = []
-        self.count_history = []
-        
-        # these are in the order that the overlays should be composited
-        model_types = {
-            'detection': args.detection,
-        }
-        
-        for key, model in model_types.items():
-            if model:
-                self.models[key] = Model(key, model=model, labels=args.labels, colors=args.colors, input_layer=args.input_layer, output_layer=args.output_layer)
+        self.processing_errors = 0
+
+        start = time.perf_counter()
+        self.models = models if models is not None else self.load_models(args)
+        self.startup['models'] = time.perf_counter() - start
+        self.trackers = {key: Model.CreateTracker(args.tracker, min_frames=args.tracker_min_frames, drop_frames=args.tracker_drop_frames,
+                                                  overlap=args.tracker_overlap, matching=args.tracker_matching, kalman=args.tracker_kalman)
+                         for key in self.models}
+        self.tracks = TrackTable()
+        self.tracks.subscribe(on_exit=self.on_track_exit)
+        self.dwell = DwellHistory(accuracy=args.dwell_accuracy, slice_seconds=args.dwell_slice, retention=args.dwell_retention)
+        self.count_history = CountHistory(args.raw_history, [int(retention) for retention in args.history_retention.split(',')])
+        self.lines = CountingLines.load(args.lines, retention=args.lines_retention)
+        self.heatmap = OccupancyHeatmap(*(int(cells) for cells in args.heatmap_grid.split('x')), slice_seconds=args.heatmap_slice,
+                                        retention=args.heatmap_retention, interval=args.heatmap_interval)
+        self.checkpointer = None
+
+        if self.checkpoint_path:
+            start = time.perf_counter()
+            self.restore_state(checkpoint_load(self.checkpoint_path))
+            self.startup['restore'] = time.perf_counter() - start
+            self.checkpointer = Checkpointer(self.checkpoint_path, self.get_state, interval=args.checkpoint_interval)
 
-        if args.log:
-            self.write_file_header()
+        self.log = None
+        self.last_results = None
+        self.motion_gate = None
+        self.roi = RegionsOfInterest.load(args.roi)
+        self.events = EventBroadcaster()
+        self.published_at = 0.0
+        self.published_count = None
+        self.viewers = ViewerTracker()
+        self.headless = self.output_url.startswith('webrtc') and not args.always_render
+        self.rendered_at = 0.0
+        self.rendered = 0
+        self.rate = RateController(target_fps=args.target_fps, budget=args.inference_budget, max_interval=args.max_inference_interval)
+        self.stages = []
+        self.stage_stats = {name: StageStats() for name in ('capture', 'inference', 'analytics', 'render', 'visualize')}
+        self.skipped = {'rate': 0, 'motion': 0}
+        self.logger = RateLimitedLogger(logger, interval=args.log_interval)
+        self.bus = None
+        self.bus_departed = None
+        self.store = store
+        self.stored = self.count_history.version(1)  # per-second buckets handed to the store so far
+
+        if args.motion_gate:
+            self.motion_gate = MotionGate(threshold=args.motion_threshold, pixel_threshold=args.motion_pixel_threshold,
+                                          force_interval=args.motion_force_interval)
+
+        if args.shm_dir:
+            self.bus = AnalyticsBus(os.path.join(args.shm_dir, f"v3m-stream{id}"))
+
+        if self.log_path:
+            self.log = CSVLogger(self.log_path, "timestamp,people_count", flush_interval=args.log_flush_interval,
+                                 batch_size=args.log_batch_size, queue_size=args.log_queue_size,
+                                 rotate=args.log_rotate, max_size=args.log_max_size, compress=args.log_compress)
             
         """
         # these are in the order that the overlays should be composited
@@ -90,95 +193,434 @@ class Stream(threading.Thread):
                 self.models['action'].fontLine = 1
         """
 
+    @staticmethod
+    def load_models(args):
+        """
+        Load the DNN models selected by the command-line arguments.
+        """
+        models = {}
+
+        # these are in the order that the overlays should be composited
+        model_types = {
+            'detection': args.detection,
+        }
+        
+        for key, model in model_types.items():
+            if model:
+                models[key] = Model(key, model=model, labels=args.labels, colors=args.colors, input_layer=args.input_layer, output_layer=args.output_layer,
+                                    profile=args.class_profile, engine_cache=args.engine_cache, tracking=(args.tracker == 'builtin'),
+                                    min_frames=args.tracker_min_frames, drop_frames=args.tracker_drop_frames, overlap=args.tracker_overlap)
+
+        return models
+
     def process(self):
         """
         Capture one image from the stream, process it, and output it.
         """
-        img = self.input.Capture()
-        
-        if img is None:  # timeout
+        frame = self.timed('capture', self.capture)
+
+        if frame is None:  # timeout
             return
-            
-        for model in self.models.values():
-            results = model.Process(img)
-            timestamp = datetime.now()#.strftime("%Y-%m-%d %H:%M:%S")
-
-            objects_count = self.get_count(results)
-            self.count_history.append((timestamp, objects_count))
-            if (self.args.log):
-                self.write_to_file(timestamp, objects_count)
-
-            people_results = self.get_people_results(results)
-            # Register new people
-            for result in people_results:
-                if result.TrackID not in self.time_ins:
-                    self.time_ins[result.TrackID] = timestamp
-            # Remove people that are not in the frame anymore
-            to_remove = []
-            for track_id in self.time_ins.keys():
-                if track_id not in [result.TrackID for result in people_results]:
-                    duration = (timestamp - self.time_ins[track_id]).total_seconds() * 1000
-                    if duration > 1000:
-                        self.duration_history.append(duration)
-                    to_remove.append(track_id)
-            for track_id in to_remove:
-                del self.time_ins[track_id]
-
-            print(f"count: {objects_count}, len(time_ins): {len(self.time_ins)}, len(duration_history): {len(self.duration_history)}")
 
-        for model in self.models.values():
-            img = model.Visualize(img)
-            
-        self.output.Render(img)
+        self.timed('inference', self.infer, frame)
+        self.timed('analytics', self.analyze, frame)
+        self.timed('render', self.render, frame)
 
-        if self.frames % 25 == 0 or self.frames < 15:
-            print(f"captured {self.frames} frames from {self.args.input} => {self.args.output} ({img.width} x {img.height})")
-   
-        self.frames += 1
+    def timed(self, stage, function, *args):
+        """
+        Call `function` and record its latency under `stage`.
+        """
+        start = time.perf_counter()
+        result = function(*args)
+        self.stage_stats[stage].record(time.perf_counter() - start)
+        return result
 
-    def get_count(self, results):
-        if self.args.detection == "peoplenet":
-            people_results = [result for result in results if result.ClassID == 0]
-            faces_results = [result for result in results if result.ClassID == 2]
-            return max(len(people_results), len(faces_results))
-        elif self.args.detection == "ssd-mobilenet-v2":
-            people_results = [result for result in results if result.ClassID == 1]
-            return len(people_results)
-        else:
-            raise Exception()
+    def capture(self):
+        """
+        Capture the next image from the input (returns None on timeout).
+        """
+        img = self.input.Capture()
+
+        if img is None:
+            return None
+
+        return Frame(img, datetime.now())
+
+    def infer(self, frame):
+        """
+        Run the models on the frame's image (taking turns with the other streams if the models are shared).
+        Frames skipped by the rate controller, or found unchanged by the motion gate, reuse
+        the previous detections instead, which keeps their tracks alive.
+        """
+        if self.last_results is not None:
+            if not self.rate.should_infer():
+                skip = 'rate'
+            elif self.motion_gate is not None and not self.motion_gate.changed(frame.img):
+                skip = 'motion'
+            else:
+                skip = None
 
-    def get_people_results(self, results):
-        if self.args.detection == "peoplenet":
-            return [result for result in results if result.ClassID == 0]
-        elif self.args.detection == "ssd-mobilenet-v2":
-            return [result for result in results if result.ClassID == 1]
+            if skip:
+                self.skipped[skip] += 1
+                frame.results = self.last_results
+                return frame
+
+        start = time.perf_counter()
+
+        if self.scheduler is not None:
+            self.scheduler.submit(self.id, self.run_models, frame)
         else:
-            raise Exception()
+            self.run_models(frame)
+
+        self.rate.record(time.perf_counter() - start)
+        return frame
+
+    def run_models(self, frame):
+        for key, model in self.models.items():
+            results = model.Process(frame.img, roi=self.roi)
+
+            # the models can be shared between streams, so each stream has its own trackers
+            if self.trackers[key] is not None and results is not None:
+                results = self.trackers[key].Update(results)
+
+            frame.results[key] = results
+
+        self.last_results = frame.results
+        return frame
+
+    def analyze(self, frame):
+        """
+        Count the people in the frame, log the count, and track how long people stay.
+        """
+        timestamp = frame.timestamp
+
+        for key, results in frame.results.items():
+            people_results, objects_count = self.models[key].profile.filter(results)
+            frame.people[key] = people_results
+            self.count_history.add(timestamp.timestamp(), objects_count)
 
-    def get_duration_history(self):
-        timestamp = datetime.now()
-        current_durations = self.duration_history + [(timestamp - t_in).total_seconds() * 1000 for t_in in self.time_ins.values()]
-        return current_durations
+            if self.store is not None:
+                self.store_buckets()
 
-    def write_to_file(self, timestamp, objects_count):
-        with open(self.args.log, "a") as f:
-            f.write(f"{timestamp},{objects_count}\n")
+            if self.log:
+                self.log.write(timestamp, objects_count)
 
-    def write_file_header(self):
-        with open(self.args.log, "w") as f:
-            f.write("timestamp,people_count\n")
+            # register new people and retire the ones that are not in the frame anymore
+            self.tracks.update(timestamp.timestamp(), people_results)
+
+            if self.lines:
+                self.lines.update(timestamp.timestamp(), self.tracks.tracks.values())
+
+            self.heatmap.add(timestamp.timestamp(), people_results, frame.img.width, frame.img.height)
+
+            self.logger.debug('count', "stream %s: count %d, tracks %d, departed %d", self.id, objects_count, len(self.tracks), self.dwell.total.count)
+
+            self.publish_events(timestamp, objects_count)
+
+            if self.bus is not None:
+                self.publish_bus(timestamp, objects_count)
+
+        return frame
+
+    def render(self, frame):
+        """
+        Draw the people overlay on the frame and send it to the output stream.
+        """
+        img = frame.img
+
+        if self.should_render():
+            start = time.perf_counter()
+
+            for key, model in self.models.items():
+                img = model.Visualize(img, frame.people.get(key))
+
+            self.stage_stats['visualize'].record(time.perf_counter() - start)
+
+            self.output.Render(img)
+            self.rendered_at = time.monotonic()
+            self.rendered += 1
+
+        self.logger.info('frames', "stream %s: captured %d frames from %s => %s (%d x %d)", self.id, self.frames, self.input_url, self.output_url, img.width, img.height)
+
+        if not self.frames:
+            self.startup['first_frame'] = time.perf_counter() - self.started
+            self.ready.set()
+            logger.info("stream %s: ready (startup %s)", self.id, ', '.join(f"{step} {seconds:.2f}s" for step, seconds in self.startup.items()))
+
+        self.frames += 1
+
+    def should_render(self):
+        """
+        WebRTC outputs are only rendered at full rate while someone is watching (a dashboard
+        subscribed to /events, or a client sending heartbeats to /viewers).  Otherwise frames
+        are rendered at --preview-fps, so new viewers still get a picture right away.
+        """
+        if not self.headless or self.events.subscribers or self.viewers.count():
+            return True
+
+        return self.args.preview_fps > 0 and time.monotonic() - self.rendered_at >= 1.0 / self.args.preview_fps
+
+    def on_track_exit(self, track, timestamp):
+        """
+        Record the dwell time of a person that left the frame (ignoring tracks shorter than a second).
+        """
+        duration = (timestamp - track.first_seen) * 1000
+
+        if duration > 1000:
+            self.dwell.add(timestamp, duration)
+
+    def publish_events(self, timestamp, count):
+        """
+        Push the live count, the latest per-second point and the dwell statistics to the
+        /events subscribers, once per second or sooner (at most every --events-interval
+        seconds) when the count changes.
+        """
+        if not self.events.subscribers:
+            return
+
+        now = timestamp.timestamp()
+
+        if int(now) == int(self.published_at) and (count == self.published_count or now - self.published_at < self.args.events_interval):
+            return
+
+        self.published_at = now
+        self.published_count = count
+
+        times, maxima, _, _ = self.count_history.series(limit=1)
+
+        self.events.publish({
+            'count': count,
+            'point': [int(times[-1] * 1000), int(maxima[-1])] if len(times) else None,
+            'durations': self.get_duration_stats(),
+        })
+
+    def store_buckets(self):
+        """
+        Queue the per-second buckets closed since the last frame for the persistent store.
+        """
+        version = self.count_history.version(1)
+
+        if version != self.stored:
+            self.store.add(self.id, self.count_history.rows(1, limit=version - self.stored))
+            self.stored = version
+
+    def publish_bus(self, timestamp, count):
+        """
+        Publish the frame to the shared-memory analytics bus (the dwell statistics
+        of the people that left are only recomputed when someone left).
+        """
+        dwell = None
+
+        if self.dwell.total.count != self.bus_departed:
+            self.bus_departed = self.dwell.total.count
+            dwell = self.get_duration_stats(current=False)
+
+        self.bus.publish(timestamp.timestamp(), count, self.tracks.tracks.values(), self.count_history, dwell)
+
+    def get_state(self):
+        """
+        Return the analytics state (count history, dwell times, tracks in view, line crossings, heatmap) for checkpoints.
+        """
+        state = {'version': np.array(1)}
+
+        for prefix, part in self.checkpoint_parts():
+            state.update({prefix + key: value for key, value in part.get_state().items()})
+
+        return state
+
+    def checkpoint_parts(self):
+        parts = [('count.', self.count_history), ('dwell.', self.dwell), ('tracks.', self.tracks), ('heatmap.', self.heatmap)]
+
+        if self.lines:
+            parts.append(('lines.', self.lines))
+
+        return parts
+
+    def restore_state(self, state):
+        """
+        Restore the analytics state from a checkpoint (parts that don't fit the current settings are skipped).
+        """
+        if state is None:
+            return
+
+        if int(state.get('version', 0)) != 1:
+            logger.warning("stream %s: ignoring checkpoint %s (unknown version)", self.id, self.checkpoint_path)
+            return
+
+        start = time.perf_counter()
+
+        for prefix, part in self.checkpoint_parts():
+            try:
+                part.set_state({key[len(prefix):]: value for key, value in state.items() if key.startswith(prefix)})
+            except (KeyError, ValueError) as error:
+                logger.warning("stream %s: couldn't restore %s from %s (%s)", self.id, prefix.rstrip('.'), self.checkpoint_path, error)
+
+        logger.info("stream %s: restored %s in %.1f ms (%d people seen, %d in view)", self.id, self.checkpoint_path,
+                    (time.perf_counter() - start) * 1000, self.dwell.total.count, len(self.tracks.restored))
+
+    def get_duration_stats(self, window=None, current=True):
+        """
+        Return the dwell-time statistics (count, mean, min/max and percentiles in ms) of the
+        people that left, over all time or the last `window` seconds, and by default
+        also of the people still in the frame.
+        """
+        now = time.time()
+        current_durations = [(now - first_seen) * 1000 for first_seen in self.tracks.first_seen()] if current else ()
+        return self.dwell.stats(window=window, now=now, current=current_durations)
 
         
     def run(self):
         """
-        Run the stream processing thread's main loop.
+        Run the stream processing thread's main loop, until stop() is called.
         """
-        while True:
+        self.warmup()
+
+        if self.args.pipeline:
+            return self.run_pipeline()
+
+        # back off when processing keeps failing, so that it doesn't spin the CPU
+        backoff = Backoff(0.01, 1.0)
+
+        while not self.stopping.is_set():
             try:
                 self.process()
-            except:
-                traceback.print_exc()
-                
+            except Exception:
+                self.processing_errors += 1
+                self.logger.error('process', "stream %s: failed to process a frame", self.id, exc_info=True)
+                self.stopping.wait(backoff.next())
+            else:
+                backoff.reset()
+
+    def stop(self):
+        """
+        Ask the processing loop (or the pipeline stages) to stop after the frame in progress.
+        """
+        self.stopping.set()
+
+    def close(self):
+        """
+        Save what the stream has pending once it stopped:  the closed per-second buckets
+        are queued for the store, the final checkpoint is written, and the log and the
+        analytics bus are closed.  The store is shared, so it's closed by the app.
+        """
+        if self.store is not None:
+            self.store_buckets()
+
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+
+        if self.log is not None:
+            self.log.close()
+
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
+
+        self.input.close()
+
+    def run_pipeline(self):
+        """
+        Run capture, inference, analytics and rendering as separate threads linked by
+        bounded drop-oldest queues, so the frame rate is bound by the slowest stage
+        instead of the sum of all of them.  The capture queue holds a single frame,
+        so inference always gets the freshest one.
+        """
+        queues = [DropOldestQueue(1), DropOldestQueue(self.args.pipeline_queue_size), DropOldestQueue(self.args.pipeline_queue_size)]
+
+        self.stages = [
+            Stage('capture', self.capture, output=queues[0], stats=self.stage_stats['capture'], log_interval=self.args.log_interval, stop=self.stopping),
+            Stage('inference', self.infer, input=queues[0], output=queues[1], stats=self.stage_stats['inference'], log_interval=self.args.log_interval, stop=self.stopping),
+            Stage('analytics', self.analyze, input=queues[1], output=queues[2], stats=self.stage_stats['analytics'], log_interval=self.args.log_interval, stop=self.stopping),
+            Stage('render', self.render, input=queues[2], stats=self.stage_stats['render'], log_interval=self.args.log_interval, stop=self.stopping),
+        ]
+
+        for stage in self.stages:
+            stage.start()
+
+        for stage in self.stages:
+            stage.join()
+
+    def warmup(self):
+        """
+        Warm up the models on blank frames of the input's size before processing the first frame.
+        """
+        start = self.started = time.perf_counter()
+
+        # the input's size is unknown until it opens (it's then retried in the background)
+        if not self.input.GetWidth():
+            return
+
+        for model in self.models.values():
+            model.Warmup(self.input.GetWidth(), self.input.GetHeight(), frames=self.args.warmup_frames)
+
+        self.startup['warmup'] = time.perf_counter() - start
+
+    def get_stage_stats(self):
+        """
+        Return the latency of each stage (and its queue depth/drops when pipelined).
+        The render stage includes the visualize step.
+        """
+        stats = {name: stats.as_dict() for name, stats in self.stage_stats.items()}
+
+        for stage in self.stages:
+            stats[stage.name] = stage.as_dict()
+
+        return stats
+
+    def collect_metrics(self, metrics):
+        """
+        Add the stream's metrics to a metrics.MetricsWriter.
+        """
+        for name, stats in self.stage_stats.items():
+            metrics.histogram('stage_latency_seconds', "Latency of each processing stage (render includes visualize)", stats, stream=self.id, stage=name)
+
+        metrics.counter('frames_processed_total', "Frames processed", self.frames, stream=self.id)
+        metrics.counter('frames_rendered_total', "Frames rendered to the output", self.rendered, stream=self.id)
+
+        for reason, count in self.skipped.items():
+            metrics.counter('frames_skipped_total', "Frames that reused the previous detections instead of running the detector", count, stream=self.id, reason=reason)
+
+        for stage in self.stages:
+            if stage.input is not None:
+                metrics.gauge('queue_depth', "Frames waiting in the pipeline queue in front of a stage", len(stage.input), stream=self.id, stage=stage.name)
+                metrics.counter('frames_dropped_total', "Frames dropped from the pipeline queue in front of a stage", stage.input.dropped, stream=self.id, stage=stage.name)
+
+        health = self.input.health()
+        metrics.gauge('input_up', "Whether the input is streaming (0 while it's reconnecting)", int(health['state'] == 'streaming'), stream=self.id)
+        metrics.counter('input_reconnects_total', "Attempts to reopen the input after it failed or stalled", health['reconnects'], stream=self.id)
+
+        for kind, count in health['errors'].items():
+            metrics.counter('input_errors_total', "Input failures (error, stall, open) and capture timeouts", count, stream=self.id, kind=kind)
+
+        metrics.counter('processing_errors_total', "Frames whose processing failed", self.processing_errors + sum(stage.errors for stage in self.stages), stream=self.id)
+        metrics.gauge('inference_interval', "Detection runs on every N-th frame", self.rate.interval, stream=self.id)
+        metrics.gauge('people_count', "People counted in the latest frame", self.count_history.last_count(), stream=self.id)
+        for key, tracker in self.trackers.items():
+            if tracker is not None:
+                metrics.gauge('tracker_tracks', "Tracks kept by the tracker, including the ones not confirmed or lost for now", len(tracker), stream=self.id, model=key)
+
+        metrics.gauge('active_tracks', "People tracked in view", len(self.tracks), stream=self.id)
+        metrics.counter('departures_total', "People that left the view after more than a second", self.dwell.total.count, stream=self.id)
+        if self.lines:
+            footfall = self.lines.footfall(limit=0)
+
+            for name, totals in footfall['lines'].items():
+                for direction, count in totals.items():
+                    metrics.counter('line_crossings_total', "People that crossed a counting line", count, stream=self.id, line=name, direction=direction)
+
+            metrics.gauge('occupancy', "People inside (that crossed the counting lines in minus out)", footfall['occupancy'], stream=self.id)
+
+        metrics.counter('heatmap_renders_total', "Heatmap tiles encoded (they are cached for --heatmap-interval)", self.heatmap.renders, stream=self.id)
+        metrics.gauge('history_bytes', "Memory used by the count history", self.count_history.nbytes, stream=self.id)
+        metrics.gauge('viewers', "Dashboards and other clients watching the stream", self.events.subscribers + self.viewers.count(), stream=self.id)
+
+        if self.log:
+            stats = self.log.stats()
+            metrics.gauge('log_queued_rows', "Rows waiting to be written to the CSV log", stats['queued'], stream=self.id)
+            metrics.counter('log_written_rows_total', "Rows written to the CSV log", stats['written'], stream=self.id)
+            metrics.counter('log_dropped_rows_total', "Rows dropped from the CSV log under backpressure", stats['dropped'], stream=self.id)
+            metrics.counter('log_write_errors_total', "Failed writes to the CSV log", stats['errors'], stream=self.id)
+
     @staticmethod
     def usage():
         """
@@ -0,0 +1,36 @@
+import numpy as np
+
+from history import RingBuffer
+
+
+def filled(capacity, count):
+    ring = RingBuffer(capacity, {'count': np.int32})
+
+    for index in range(count):
+        ring.append(1000.0 + index, count=index)
+
+    return ring
+
+
+def test_restore_into_larger_capacity():
+    ring = RingBuffer(20, {'count': np.int32})
+    ring.set_state(filled(10, 15).get_state())
+
+    times, columns = ring.query()
+    assert len(ring) == 10
+    assert times.tolist() == [1005.0 + index for index in range(10)]
+    assert columns['count'].tolist() == list(range(5, 15))
+
+    ring.append(1015.0, count=15)
+    assert ring.query()[0].tolist() == [1005.0 + index for index in range(11)]
+
+
+def test_restore_into_smaller_capacity():
+    ring = RingBuffer(5, {'count': np.int32})
+    ring.set_state(filled(10, 15).get_state())
+
+    times, columns = ring.query()
+    assert len(ring) == 5
+    assert times.tolist() == [1010.0 + index for index in range(5)]
+    assert columns['count'].tolist() == list(range(10, 15))
+    assert ring.query(since=1012.0)[0].tolist() == [1013.0, 1014.0]
@@ -0,0 +1,159 @@
+import numpy as np
+
+
+class Track:
+    """
+    State of one tracked person (times are epoch seconds, bbox is (left, top, right, bottom)).
+    """
+    __slots__ = ('track_id', 'first_seen', 'last_seen', 'bbox')
+
+    def __init__(self, track_id, first_seen, bbox):
+        self.track_id = track_id
+        self.first_seen = first_seen
+        self.last_seen = first_seen
+        self.bbox = bbox
+
+
+class TrackTable:
+    """
+    The people currently in view of a stream, keyed by track ID.  Each frame's
+    detections are folded in with a single pass, and listeners are told when
+    a track enters (first seen) or exits (missing from a frame).
+    """
+    def __init__(self):
+        self.tracks = {}
+        self.enter_listeners = []
+        self.exit_listeners = []
+        self.restored = []          # tracks from a checkpoint, waiting to be matched to new track IDs
+        self.handover_seconds = 0.0
+        self.handover_until = None  # set from the first frame after the restore
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def subscribe(self, on_enter=None, on_exit=None):
+        """
+        Register callbacks, called as on_enter(track, timestamp) and on_exit(track, timestamp).
+        """
+        if on_enter is not None:
+            self.enter_listeners.append(on_enter)
+
+        if on_exit is not None:
+            self.exit_listeners.append(on_exit)
+
+    def update(self, timestamp, detections):
+        """
+        Update the table with a frame's detections of people (at `timestamp`, in epoch seconds).
+        Detections that aren't tracked yet (TrackID -1) are skipped.
+        """
+        tracks = self.tracks
+        seen = set()
+
+        for detection in detections:
+            track_id = detection.TrackID
+
+            if track_id < 0:
+                continue
+
+            bbox = (detection.Left, detection.Top, detection.Right, detection.Bottom)
+            track = tracks.get(track_id)
+            seen.add(track_id)
+
+            if track is None:
+                track = tracks[track_id] = Track(track_id, self.handover(bbox, timestamp) if self.restored else timestamp, bbox)
+                track.last_seen = timestamp
+
+                for listener in self.enter_listeners:
+                    listener(track, timestamp)
+            else:
+                track.last_seen = timestamp
+                track.bbox = bbox
+
+        if self.restored:
+            if self.handover_until is None:
+                self.handover_until = timestamp + self.handover_seconds
+            elif timestamp >= self.handover_until:
+                self.expire_restored()
+
+        if len(seen) == len(tracks):
+            return
+
+        for track_id in [track_id for track_id in tracks if track_id not in seen]:
+            track = tracks.pop(track_id)
+
+            for listener in self.exit_listeners:
+                listener(track, timestamp)
+
+    def first_seen(self):
+        """
+        Return the first-seen times of the tracks in view.
+        """
+        return [track.first_seen for track in list(self.tracks.values()) + self.restored]
+
+    def get_state(self):
+        """
+        Return the tracks in view as numpy arrays (for checkpoints).
+        """
+        tracks = list(self.tracks.values()) + self.restored
+
+        return {
+            'track_id': np.array([track.track_id for track in tracks], dtype=np.int64),
+            'first_seen': np.array([track.first_seen for track in tracks], dtype=np.float64),
+            'last_seen': np.array([track.last_seen for track in tracks], dtype=np.float64),
+            'bbox': np.array([track.bbox for track in tracks], dtype=np.float32).reshape(-1, 4),
+        }
+
+    def set_state(self, state, handover=5.0):
+        """
+        Restore the tracks saved by get_state().  The detector numbers its tracks anew after
+        a restart, so each restored track is handed over to the first new track that overlaps
+        it (keeping its first-seen time) within `handover` seconds of the first frame;
+        the ones left are retired as of when they were last seen.
+        """
+        self.restored = []
+
+        for track_id, first_seen, last_seen, bbox in zip(state['track_id'].tolist(), state['first_seen'].tolist(),
+                                                         state['last_seen'].tolist(), state['bbox'].tolist()):
+            track = Track(track_id, first_seen, tuple(bbox))
+            track.last_seen = last_seen
+            self.restored.append(track)
+
+        self.handover_seconds = handover
+        self.handover_until = None
+
+    def handover(self, bbox, timestamp, min_iou=0.3):
+        """
+        Return the first-seen time of the restored track that overlaps `bbox` the most
+        (and drop it), or `timestamp` if none overlaps it enough.
+        """
+        best, best_iou = None, min_iou
+
+        for track in self.restored:
+            iou = self.iou(bbox, track.bbox)
+
+            if iou >= best_iou:
+                best, best_iou = track, iou
+
+        if best is None:
+            return timestamp
+
+        self.restored.remove(best)
+        return best.first_seen
+
+    def expire_restored(self):
+        for track in self.restored:
+            for listener in self.exit_listeners:
+                listener(track, track.last_seen)
+
+        self.restored = []
+
+    @staticmethod
+    def iou(a, b):
+        width = min(a[2], b[2]) - max(a[0], b[0])
+        height = min(a[3], b[3]) - max(a[1], b[1])
+
+        if width <= 0 or height <= 0:
+            return 0.0
+
+        intersection = width * height
+        return intersection / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection)
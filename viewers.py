@@ -0,0 +1,34 @@
+import time
+import threading
+
+
+class ViewerTracker:
+    """
+    Keeps track of who is watching a stream's video, from heartbeats sent by the
+    clients, so rendering can be skipped while nobody is watching.
+    """
+    def __init__(self, timeout=10.0):
+        """
+        Parameters:
+
+            timeout (float) -- seconds without a heartbeat after which a viewer is considered gone
+        """
+        self.timeout = timeout
+        self.heartbeats = {}  # client => time of its last heartbeat
+        self.lock = threading.Lock()
+
+    def heartbeat(self, client):
+        with self.lock:
+            self.heartbeats[client] = time.monotonic()
+
+    def count(self):
+        """
+        Return the number of viewers that sent a heartbeat within the timeout.
+        """
+        expired = time.monotonic() - self.timeout
+
+        with self.lock:
+            for client in [client for client, last in self.heartbeats.items() if last < expired]:
+                del self.heartbeats[client]
+
+            return len(self.heartbeats)
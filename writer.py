@@ -0,0 +1,124 @@
+import abc
+import time
+import queue
+import threading
+
+from metrics import RateLimitedLogger
+
+
+class BatchWriter(threading.Thread, abc.ABC):
+    """
+    Thread that writes queued rows in batches, off the frame loop.  A batch is written
+    when it reaches `batch_size` rows or `flush_interval` seconds after its first row.
+    If the writes can't keep up and the queue fills, new rows are dropped and counted.
+    Subclasses implement write_batch(), raising one of ERRORS when a batch is lost.
+    """
+    ERRORS = (OSError,)
+
+    def __init__(self, path, logger, flush_interval=1.0, batch_size=500, queue_size=10000, log_interval=10.0):
+        """
+        Parameters:
+
+            path (string) -- the file written to (for the error messages)
+            logger (logging.Logger) -- where to report the failed writes
+            flush_interval (float) -- seconds to wait for a batch to fill before writing it anyway
+            batch_size (int) -- number of rows written per batch at most
+            queue_size (int) -- number of rows that can be pending before new ones are dropped
+            log_interval (float) -- seconds between repeated error messages
+        """
+        super().__init__(daemon=True)
+
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.logger = RateLimitedLogger(logger, interval=log_interval)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def put(self, row):
+        """
+        Queue a row for writing.  Never blocks; returns False if the row was dropped.
+        """
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stats(self):
+        """
+        Return the writer's counters (rows queued, written and dropped, flushes, write errors).
+        """
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'errors': self.errors,
+        }
+
+    def close(self, timeout=10.0):
+        """
+        Flush the pending rows and stop the writer thread.
+        """
+        if self.is_alive():
+            self.queue.put(None)
+            self.join(timeout=timeout)
+
+    def run(self):
+        """
+        Run the writer thread's main loop.
+        """
+        while True:
+            row = self.queue.get()
+
+            if row is None:
+                return
+
+            rows = [row]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    row = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if row is None:
+                    self.flush(rows)
+                    return
+
+                rows.append(row)
+
+            self.flush(rows)
+
+    def flush(self, rows):
+        """
+        Write a batch of rows, counting them as dropped if it fails.
+        """
+        try:
+            self.write_batch(rows)
+        except self.ERRORS:
+            self.errors += 1
+            self.dropped += len(rows)
+            self.logger.error('write', "couldn't write %d rows to %s", len(rows), self.path, exc_info=True)
+            return
+
+        self.written += len(rows)
+        self.flushes += 1
+
+    @abc.abstractmethod
+    def write_batch(self, rows):
+        """
+        Write a batch of rows (raising one of ERRORS if they're lost).
+        """